@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/deals/search latency on a large database
+
+Builds a fresh database through the app (migrations, FTS5 indexes and
+triggers included), loads synthetic deals and notes with random words from
+a fixed vocabulary, then times the search endpoint for rare, common and
+prefix terms. Queries run through the Flask test client, so the timings
+include routing, RBAC scoping and serialization of the first page.
+
+Usage (from backend/):
+    python benchmarks/bench_deal_search.py [--deals 50000] [--notes 500000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+VOCABULARY = [f'w{i}' for i in range(20000)]
+QUERIES = ['Customer4242', 'spoc777@cust777.com', 'w17', 'w17 w18', 'Cus', 'w1']
+
+def load(conn, deals, notes, batch=10000):
+    conn.exec_driver_sql("INSERT INTO companies (name, created_at) VALUES ('Partner', CURRENT_TIMESTAMP)")
+    for start in range(0, deals, batch):
+        conn.exec_driver_sql(
+            'INSERT INTO deals (company_id, customer_company, customer_spoc, customer_spoc_email, '
+            'revenue_arr, status, comments, created_at, updated_at) VALUES ' + ','.join(
+                f"(1, 'Customer{i}', 'Spoc {i}', 'spoc{i}@cust{i}.com', 100, 'Open', "
+                f"'{' '.join(random.choices(VOCABULARY, k=8))}', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+                for i in range(start, min(start + batch, deals))))
+    for start in range(0, notes, batch):
+        conn.exec_driver_sql(
+            'INSERT INTO deal_notes (deal_id, user_id, note_text, created_at) VALUES ' + ','.join(
+                f"({random.randint(1, deals)}, 1, '{' '.join(random.choices(VOCABULARY, k=20))}', CURRENT_TIMESTAMP)"
+                for _ in range(min(batch, notes - start))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--deals', type=int, default=50000)
+    parser.add_argument('--notes', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # The app keeps its database under ./src/database
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'src', 'database'))
+    os.chdir(workdir)
+    from src.main import app
+    from src.bootstrap import bootstrap
+    from src.models.database import db
+    bootstrap(app)
+
+    random.seed(1)
+    started = time.time()
+    with app.app_context(), db.engine.begin() as conn:
+        load(conn, args.deals, args.notes)
+    print(f'Loaded {args.deals} deals and {args.notes} notes in {time.time() - started:.1f}s')
+
+    client = app.test_client()
+    for q in QUERIES:
+        client.get('/api/deals/search', query_string={'q': q})
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.get('/api/deals/search', query_string={'q': q})
+        elapsed = (time.perf_counter() - started) / args.repeat * 1000
+        print(f'{q!r:24} {len(response.json["deals"]):3} results  {elapsed:6.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent reads/writes with and without the SQLite storage profile
+
+Starts reader and writer processes (standing in for gunicorn workers)
+against a fresh database with the deals schema. Run once with the untuned
+connection the app used before (sqlite3.connect defaults: rollback journal
+and pysqlite's 5 s busy timeout) and once with the profile from
+src/models/storage.py (WAL, synchronous=NORMAL, busy_timeout, mmap, cache).
+It reports committed writes, completed reads and "database is locked" errors.
+
+Usage (from backend/):
+    python benchmarks/bench_sqlite_profile.py [--seconds 5] [--readers 4] [--writers 2] [--rows 20000]
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.models.storage import apply_pragmas, storage_settings
+
+SCHEMA = """
+CREATE TABLE deals (
+    id INTEGER PRIMARY KEY,
+    company_id INTEGER NOT NULL,
+    customer_company VARCHAR(200) NOT NULL,
+    revenue_arr FLOAT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    created_at DATETIME
+);
+CREATE INDEX ix_deals_company_id ON deals (company_id);
+"""
+
+def connect(path, profile):
+    if profile:
+        conn = sqlite3.connect(path, timeout=storage_settings()['busy_timeout'] / 1000.0)
+        apply_pragmas(conn)
+    else:
+        # The untuned engine: sqlite3.connect defaults (rollback journal, 5 s busy timeout)
+        conn = sqlite3.connect(path)
+    return conn
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO deals (company_id, customer_company, revenue_arr, status, created_at) "
+        "VALUES (?, ?, ?, ?, datetime('now'))",
+        ((i % 200, f'Customer {i}', float(i % 1000), ('Open', 'Won', 'Lost')[i % 3]) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+def reader(path, profile, deadline, results):
+    conn = connect(path, profile)
+    done = errors = 0
+    while time.time() < deadline:
+        try:
+            conn.execute(
+                "SELECT company_id, COUNT(*), SUM(revenue_arr) FROM deals "
+                "WHERE status = 'Won' GROUP BY company_id").fetchall()
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(('read', done, errors))
+
+def writer(path, profile, deadline, results):
+    conn = connect(path, profile)
+    done = errors = 0
+    i = 0
+    while time.time() < deadline:
+        i += 1
+        try:
+            conn.execute(
+                "INSERT INTO deals (company_id, customer_company, revenue_arr, status, created_at) "
+                "VALUES (?, ?, ?, 'Open', datetime('now'))", (i % 200, f'New {i}', 100.0))
+            conn.execute("UPDATE deals SET status = 'Won' WHERE id = ?", (i,))
+            conn.commit()
+            done += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+    conn.close()
+    results.put(('write', done, errors))
+
+def run(profile, args):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.db')
+    seed(path, args.rows)
+    # Switch the file to WAL (persistent) before the workers start
+    connect(path, profile).close()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    procs = [multiprocessing.Process(target=reader, args=(path, profile, deadline, results))
+             for _ in range(args.readers)]
+    procs += [multiprocessing.Process(target=writer, args=(path, profile, deadline, results))
+              for _ in range(args.writers)]
+    for p in procs:
+        p.start()
+    totals = {'read': [0, 0], 'write': [0, 0]}
+    for _ in procs:
+        kind, done, errors = results.get()
+        totals[kind][0] += done
+        totals[kind][1] += errors
+    for p in procs:
+        p.join()
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.rows} seed rows, {args.seconds}s per run')
+    print(f"{'profile':<10}{'reads/s':>12}{'read errors':>14}{'writes/s':>12}{'write errors':>14}")
+    for name, profile in (('default', False), ('tuned', True)):
+        totals = run(profile, args)
+        print(f"{name:<10}{totals['read'][0] / args.seconds:>12.0f}{totals['read'][1]:>14}"
+              f"{totals['write'][0] / args.seconds:>12.0f}{totals['write'][1]:>14}")
+
+if __name__ == '__main__':
+    main()
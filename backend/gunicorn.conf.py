@@ -0,0 +1,41 @@
+"""
+Gunicorn serving profile for the Partner Portal API
+
+The database is bootstrapped once, by `flask bootstrap` run from the master
+before any worker is forked, so the worker count can be raised freely. The
+master never imports the app itself: each worker loads it after the fork,
+and a HUP (graceful reload) picks up new code and re-runs the bootstrap. Each worker runs
+several threads (gthread); bcrypt and SQLite release the GIL, so threads
+overlap I/O and hashing. SQLAlchemy connection pools are discarded in each
+forked child (see create_app) so no connection is shared across processes.
+
+Tune with WEB_CONCURRENCY (workers), GUNICORN_THREADS, GUNICORN_TIMEOUT and
+GUNICORN_BIND.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Load the app in each worker, after the fork
+preload_app = False
+
+def _bootstrap():
+    """Run `flask bootstrap` in a child process, keeping the app out of the master"""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.main:app', 'bootstrap'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+def on_starting(server):
+    """Run the one-shot bootstrap before workers are spawned"""
+    _bootstrap()
+
+def on_reload(server):
+    """Apply the new code's migrations before the reloaded workers start"""
+    _bootstrap()
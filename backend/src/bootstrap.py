@@ -0,0 +1,30 @@
+"""
+One-shot database bootstrap (schema creation, admin seeding and funnel snapshots)
+
+Runs once before workers start - `flask bootstrap`, which gunicorn's
+on_starting hook runs - instead of inside every worker's create_app(). An
+exclusive file lock next to the database serializes concurrent runs (for
+example several containers sharing a volume), so create_all and the admin
+insert never race.
+"""
+import fcntl
+import os
+from src.models.database import init_db
+from src.utils.deal_funnel import refresh_funnel_snapshots
+
+def bootstrap(app):
+    """
+    Create/upgrade the schema, seed the admin user and snapshot finished funnel
+    days under an exclusive file lock
+    """
+    lock_path = os.path.join(os.path.dirname(app.config['DATABASE_PATH']), '.bootstrap.lock')
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with app.app_context():
+                init_db()
+                refresh_funnel_snapshots()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -3,8 +3,14 @@ Omniful Partner Portal - Main Application
 """
 from flask import Flask, jsonify
 from flask_cors import CORS
-from src.models.database import db, init_db
-from src.routes import auth, users, companies, deals, targets, payouts, pam_assignments, analytics
+from src.models.database import db, ensure_indexes
+from src.models.storage import engine_options, register_storage_profile
+from src.models import migrations
+from src.routes import auth, users, companies, deals, targets, payouts, pam_assignments, analytics, sync
+from src.utils import deal_stats, deal_funnel, query_plans
+from src.utils.compression import register_compression
+from src.bootstrap import bootstrap
+import click
 import os
 
 def create_app():
@@ -14,8 +20,11 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
     # Use absolute path for database in container
     db_path = os.path.join(os.getcwd(), 'src', 'database', 'app.db')
+    app.config['DATABASE_PATH'] = db_path
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool sizing/recycling (DB_POOL_* environment variables)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
     
     # Initialize CORS
     CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -23,9 +32,21 @@ def create_app():
     # Initialize database
     db.init_app(app)
     
-    # Create tables and initialize data
+    # WAL, busy timeout, mmap and cache PRAGMAs on every connection (SQLITE_* variables)
     with app.app_context():
-        init_db()
+        register_storage_profile(db.engine)
+    
+    # A forked worker must not reuse connections opened by its parent;
+    # drop the inherited pool (without closing the parent's connections)
+    def dispose_engine_after_fork():
+        with app.app_context():
+            db.engine.dispose(close=False)
+    os.register_at_fork(after_in_child=dispose_engine_after_fork)
+    
+    # Tables and the admin user are created by the one-shot bootstrap
+    # (`flask bootstrap`, run by gunicorn's on_starting hook), not per worker
+    if os.getenv('BOOTSTRAP_ON_START') == '1':
+        bootstrap(app)
     
     # Register blueprints
     app.register_blueprint(auth.bp, url_prefix='/api/auth')
@@ -36,6 +57,105 @@ def create_app():
     app.register_blueprint(payouts.bp, url_prefix='/api/payouts')
     app.register_blueprint(pam_assignments.bp, url_prefix='/api/pam-assignments')
     app.register_blueprint(analytics.bp, url_prefix='/api/analytics')
+    app.register_blueprint(sync.bp, url_prefix='/api/sync')
+    
+    # gzip for JSON/text responses above GZIP_MIN_SIZE bytes
+    register_compression(app)
+    
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create/upgrade the schema and seed the admin user"""
+        bootstrap(app)
+        click.echo('Database bootstrap complete')
+    
+    # Schema migrations: flask migrations status | upgrade
+    @app.cli.group('migrations')
+    def migrations_cli():
+        """Inspect and apply versioned schema migrations"""
+    
+    @migrations_cli.command('status')
+    def migrations_status():
+        """Show the schema version and any pending migrations"""
+        with db.engine.connect() as conn:
+            version = migrations.current_version(conn)
+        click.echo(f"Schema version: {version if version is not None else 'unversioned'} "
+                   f"(latest {migrations.LATEST_VERSION})")
+        for migration in migrations.pending_migrations(version):
+            click.echo(f'  pending {migration.version}: {migration.description}')
+    
+    @migrations_cli.command('upgrade')
+    def migrations_upgrade():
+        """Apply pending migrations"""
+        applied = migrations.migrate(log=click.echo)
+        click.echo(f'Applied {len(applied)} migration(s)' if applied else 'Schema is up to date')
+    
+    # Maintenance commands: flask deal-stats verify [--repair] | rebuild
+    @app.cli.group('deal-stats')
+    def deal_stats_cli():
+        """Maintain the company_deal_stats and deal_daily_stats rollups"""
+    
+    @deal_stats_cli.command('verify')
+    @click.option('--repair', is_flag=True, help='Rebuild a rollup if drift is found')
+    def verify_deal_stats(repair):
+        """Compare the rollups with the deals table"""
+        failed = False
+        for table, verify, rebuild in (
+                ('company_deal_stats', deal_stats.verify_company_deal_stats, deal_stats.rebuild_company_deal_stats),
+                ('deal_daily_stats', deal_stats.verify_deal_daily_stats, deal_stats.rebuild_deal_daily_stats)):
+            drift = verify()
+            for item in drift:
+                day = f" on {item['day']}" if 'day' in item else ''
+                click.echo(f"{table}: company {item['company_id']}{day}: {item['field']} "
+                           f"expected {item['expected']}, found {item['actual']}")
+            if not drift:
+                click.echo(f'{table} is consistent')
+            elif repair:
+                rebuild()
+                click.echo(f'Repaired {len(drift)} drifted value(s) in {table}')
+            else:
+                failed = True
+        if failed:
+            raise SystemExit(1)
+    
+    @deal_stats_cli.command('rebuild')
+    def rebuild_deal_stats():
+        """Recompute the rollups from the deals table"""
+        deal_stats.rebuild_company_deal_stats()
+        deal_stats.rebuild_deal_daily_stats()
+        click.echo('company_deal_stats and deal_daily_stats rebuilt')
+    
+    # Funnel snapshots: flask deal-funnel refresh [--rebuild] (run daily after midnight UTC)
+    @app.cli.group('deal-funnel')
+    def deal_funnel_cli():
+        """Maintain the daily funnel/velocity snapshots"""
+    
+    @deal_funnel_cli.command('refresh')
+    @click.option('--rebuild', is_flag=True, help='Recompute every day from the status event log')
+    def refresh_deal_funnel(rebuild):
+        """Snapshot finished days not stored yet"""
+        days = deal_funnel.refresh_funnel_snapshots(rebuild=rebuild)
+        click.echo(f'Computed {days} day(s) of funnel snapshots')
+    
+    # Index maintenance: flask query-plans check | create-indexes
+    @app.cli.group('query-plans')
+    def query_plans_cli():
+        """Check that route queries are served by indexes"""
+    
+    @query_plans_cli.command('check')
+    def check_query_plans():
+        """Fail if any route query plan scans a whole table"""
+        failures = query_plans.find_full_scans()
+        for label, plan in failures:
+            click.echo(f"{label}: {' | '.join(plan)}")
+        if failures:
+            raise SystemExit(1)
+        click.echo('All route queries use an index')
+    
+    @query_plans_cli.command('create-indexes')
+    def create_indexes():
+        """Build missing indexes one at a time (safe while the app is serving)"""
+        created = ensure_indexes()
+        click.echo(f"Created {len(created)} index(es){': ' + ', '.join(created) if created else ''}")
     
     # Health check endpoint
     @app.route('/api/health')
@@ -56,5 +176,6 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    bootstrap(app)
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
 
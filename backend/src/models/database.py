@@ -3,7 +3,9 @@ Database configuration and initialization
 """
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import bcrypt
+from sqlalchemy import event
+from sqlalchemy.orm import validates
+from src.utils.passwords import hash_password, verify_password, needs_rehash
 
 db = SQLAlchemy()
 
@@ -11,9 +13,34 @@ db = SQLAlchemy()
 pam_company_assignments = db.Table('pam_company_assignments',
     db.Column('pam_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('company_id', db.Integer, db.ForeignKey('companies.id'), primary_key=True),
-    db.Column('assigned_at', db.DateTime, default=datetime.utcnow)
+    db.Column('assigned_at', db.DateTime, default=datetime.utcnow),
+    # The PK covers lookups by pam_id; this covers "which PAMs manage company X"
+    db.Index('ix_pam_company_assignments_company_id', 'company_id')
 )
 
+# Inverted indexes of the comma-separated Company.tags / Company.serving_regions,
+# one row per (company, value); maintained by src/utils/company_facets.py
+company_tags = db.Table('company_tags',
+    db.Column('company_id', db.Integer, db.ForeignKey('companies.id'), primary_key=True),
+    db.Column('tag', db.String(100, collation='NOCASE'), primary_key=True),
+    db.Index('ix_company_tags_tag', 'tag')
+)
+
+company_regions = db.Table('company_regions',
+    db.Column('company_id', db.Integer, db.ForeignKey('companies.id'), primary_key=True),
+    db.Column('region', db.String(100, collation='NOCASE'), primary_key=True),
+    db.Index('ix_company_regions_region', 'region')
+)
+
+def split_list(value):
+    """Items of a comma-separated column value, stripped, blanks and repeats dropped"""
+    items = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if item and item.lower() not in (seen.lower() for seen in items):
+            items.append(item)
+    return items
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -21,33 +48,45 @@ class User(db.Model):
     username = db.Column(db.String(100), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(50), nullable=False)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=True)
+    role = db.Column(db.String(50), nullable=False, index=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=True, index=True)
     phone_number = db.Column(db.String(50))
     photo_url = db.Column(db.String(500))
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bump to revoke issued tokens
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship for PAM multi-company assignments
     assigned_companies = db.relationship('Company', secondary=pam_company_assignments,
                                         backref=db.backref('assigned_pams', lazy='dynamic'))
     
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return verify_password(password, self.password_hash)
     
-    def to_dict(self):
+    def password_needs_rehash(self):
+        """True when the stored hash predates the configured bcrypt cost"""
+        return needs_rehash(self.password_hash)
+    
+    def to_dict(self, company_names=None, assigned_company_map=None):
         # Get assigned companies for PAM role
         assigned_company_ids = []
         if self.role == 'PAM':
-            assigned_company_ids = [c.id for c in self.assigned_companies]
+            if assigned_company_map is not None:
+                assigned_company_ids = assigned_company_map.get(self.id, [])
+            else:
+                assigned_company_ids = [c.id for c in self.assigned_companies]
         
         # Get company info if user is assigned to a company
         company_name = None
         if self.company_id:
-            company = Company.query.get(self.company_id)
-            company_name = company.name if company else None
+            if company_names is not None:
+                company_name = company_names.get(self.company_id)
+            else:
+                company = Company.query.get(self.company_id)
+                company_name = company.name if company else None
         
         return {
             'id': self.id,
@@ -59,7 +98,8 @@ class User(db.Model):
             'phone_number': self.phone_number,
             'photo_url': self.photo_url,
             'assigned_company_ids': assigned_company_ids,  # For PAM multi-company assignment
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 class Company(db.Model):
@@ -68,31 +108,30 @@ class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), unique=True, nullable=False)
     company_type = db.Column(db.String(50), default='Partner')  # Partner, Customer, Affiliate
-    website = db.Column(db.String(255))
-    contact_email = db.Column(db.String(120))
+    website = db.Column(db.String(255), index=True)  # Indexed for the duplicate checks on create/update
+    contact_email = db.Column(db.String(120), index=True)
     contact_phone = db.Column(db.String(50))
     logo_url = db.Column(db.String(500))
     spoc_name = db.Column(db.String(100))
-    spoc_email = db.Column(db.String(120))
+    spoc_email = db.Column(db.String(120), index=True)
     spoc_phone = db.Column(db.String(50))
     country = db.Column(db.String(100))
     serving_regions = db.Column(db.String(500))
     partner_stage = db.Column(db.String(50), default='Registered')  # Registered, Implementing, Reseller, Strategic
     published = db.Column(db.Boolean, default=False)
     tags = db.Column(db.String(500))  # Comma-separated tags
-    pam_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    pam_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     payout_percentage = db.Column(db.Float, default=0.0)  # Percentage for payouts
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    def to_dict(self, user_names=None):
         # Get PAM name if assigned
-        pam_user = User.query.get(self.pam_id) if self.pam_id else None
-        pam_name = pam_user.username if pam_user else None
-        
-        # Convert tags string to array
-        tags_array = []
-        if self.tags:
-            tags_array = [tag.strip() for tag in self.tags.split(',') if tag.strip()]
+        if user_names is not None:
+            pam_name = user_names.get(self.pam_id) if self.pam_id else None
+        else:
+            pam_user = User.query.get(self.pam_id) if self.pam_id else None
+            pam_name = pam_user.username if pam_user else None
         
         return {
             'id': self.id,
@@ -110,12 +149,13 @@ class Company(db.Model):
             'partner_stage': self.partner_stage,
             'published': self.published if self.published is not None else False,
             'published_on_website': self.published if self.published is not None else False,  # Alias for frontend compatibility
-            'tags': tags_array,
+            'tags': split_list(self.tags),
             'pam_id': self.pam_id,
             'assigned_pam_id': self.pam_id,  # Alias for frontend compatibility
             'pam_name': pam_name,
             'payout_percentage': self.payout_percentage or 0.0,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 class Deal(db.Model):
@@ -134,13 +174,39 @@ class Deal(db.Model):
     comments = db.Column(db.Text)
     proof_of_engagement = db.Column(db.String(500))  # File path/URL
     proof_of_sale = db.Column(db.String(500))  # File path/URL
+    won_at = db.Column(db.DateTime, nullable=True)  # When the deal last became Won; None unless Won
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    # Composite indexes backing keyset pagination: each (filter, sort key, id)
+    # combination used by the deals list endpoints is an index range scan
+    __table_args__ = (
+        db.Index('ix_deals_created_at_id', 'created_at', 'id'),
+        db.Index('ix_deals_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_deals_company_created_at_id', 'company_id', 'created_at', 'id'),
+        db.Index('ix_deals_company_updated_at_id', 'company_id', 'updated_at', 'id'),
+        db.Index('ix_deals_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_deals_status_updated_at_id', 'status', 'updated_at', 'id'),
+        db.Index('ix_deals_company_status', 'company_id', 'status'),
+        db.Index('ix_deals_won_at', 'won_at'),
+    )
+    
+    @validates('status')
+    def _stamp_won_at(self, key, status):
+        if status == 'Won':
+            if self.status != 'Won' or self.won_at is None:
+                self.won_at = datetime.utcnow()
+        else:
+            self.won_at = None
+        return status
+    
+    def to_dict(self, company_names=None):
         # Get partner company name
-        partner_company = Company.query.get(self.company_id)
-        partner_company_name = partner_company.name if partner_company else None
+        if company_names is not None:
+            partner_company_name = company_names.get(self.company_id)
+        else:
+            partner_company = Company.query.get(self.company_id)
+            partner_company_name = partner_company.name if partner_company else None
         
         return {
             'id': self.id,
@@ -158,6 +224,7 @@ class Deal(db.Model):
             'comments': self.comments,
             'proof_of_engagement': self.proof_of_engagement,
             'proof_of_sale': self.proof_of_sale,
+            'won_at': self.won_at.isoformat() if self.won_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -173,19 +240,29 @@ class Target(db.Model):
     target_period = db.Column(db.String(50), nullable=False)  # monthly, quarterly, yearly
     description = db.Column(db.String(500), nullable=True, default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_targets_type_entity', 'target_type', 'target_entity_id'),
+    )
+    
+    def to_dict(self, user_names=None, company_names=None):
         # Get entity name based on type
         entity_name = 'Unknown'
-        if self.target_type == 'PAM':
-            user = User.query.get(self.target_entity_id)
-            entity_name = user.username if user else 'Unknown PAM'
+        if self.target_type in ('PAM', 'SPOC'):
+            if user_names is not None:
+                username = user_names.get(self.target_entity_id)
+            else:
+                user = User.query.get(self.target_entity_id)
+                username = user.username if user else None
+            entity_name = username or f'Unknown {self.target_type}'
         elif self.target_type == 'Company':
-            company = Company.query.get(self.target_entity_id)
-            entity_name = company.name if company else 'Unknown Company'
-        elif self.target_type == 'SPOC':
-            user = User.query.get(self.target_entity_id)
-            entity_name = user.username if user else 'Unknown SPOC'
+            if company_names is not None:
+                company_name = company_names.get(self.target_entity_id)
+            else:
+                company = Company.query.get(self.target_entity_id)
+                company_name = company.name if company else None
+            entity_name = company_name or 'Unknown Company'
         
         return {
             'id': self.id,
@@ -196,9 +273,102 @@ class Target(db.Model):
             'target_value': self.target_value,
             'target_period': self.target_period,
             'description': self.description or '',
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CompanyDealStats(db.Model):
+    """Per-company deal rollup, kept in step with deal writes (see src/utils/deal_stats.py)"""
+    __tablename__ = 'company_deal_stats'
+    
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), primary_key=True)
+    total_deals = db.Column(db.Integer, nullable=False, default=0)
+    won_deals = db.Column(db.Integer, nullable=False, default=0)
+    won_revenue = db.Column(db.Float, nullable=False, default=0.0)  # revenue_actual or revenue_arr of won deals
+    open_deals = db.Column(db.Integer, nullable=False, default=0)
+    open_pipeline_value = db.Column(db.Float, nullable=False, default=0.0)  # revenue_arr of open deals
+    in_progress_deals = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'company_id': self.company_id,
+            'total_deals': self.total_deals,
+            'won_deals': self.won_deals,
+            'won_revenue': self.won_revenue,
+            'open_deals': self.open_deals,
+            'open_pipeline_value': self.open_pipeline_value,
+            'in_progress_deals': self.in_progress_deals,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class PayoutRun(db.Model):
+    """One batch payout calculation over newly won deals"""
+    __tablename__ = 'payout_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    payouts_created = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    watermark = db.Column(db.DateTime, nullable=True)  # Latest deal updated_at covered by this run
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'payouts_created': self.payouts_created,
+            'total_amount': self.total_amount,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class Payout(db.Model):
+    __tablename__ = 'payouts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    deal_id = db.Column(db.Integer, db.ForeignKey('deals.id'), nullable=False, unique=True)  # One payout per won deal
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    run_id = db.Column(db.Integer, db.ForeignKey('payout_runs.id'), nullable=True, index=True)
+    revenue_arr = db.Column(db.Float, nullable=False)
+    payout_percentage = db.Column(db.Float, nullable=False, default=0.0)  # Company percentage at calculation time
+    payout_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(50), nullable=False, default='Pending')  # Pending, Approved, Rejected
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_payouts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_payouts_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_payouts_company_created_at_id', 'company_id', 'created_at', 'id'),
+    )
+    
+    def to_dict(self, company_names=None, customer_companies=None):
+        if company_names is not None:
+            company_name = company_names.get(self.company_id)
+        else:
+            company = Company.query.get(self.company_id)
+            company_name = company.name if company else None
+        
+        if customer_companies is not None:
+            customer_company = customer_companies.get(self.deal_id)
+        else:
+            deal = Deal.query.get(self.deal_id)
+            customer_company = deal.customer_company if deal else None
+        
+        return {
+            'id': self.id,
+            'deal_id': self.deal_id,
+            'company_id': self.company_id,
+            'company_name': company_name,
+            'customer_company': customer_company,
+            'run_id': self.run_id,
+            'revenue_arr': self.revenue_arr,
+            'payout_percentage': self.payout_percentage,
+            'payout_amount': self.payout_amount,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 class DealNote(db.Model):
     __tablename__ = 'deal_notes'
     
@@ -209,10 +379,17 @@ class DealNote(db.Model):
     note_type = db.Column(db.String(50), default='general')  # general, status_change, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_deal_notes_deal_created_at', 'deal_id', 'created_at'),
+    )
+    
+    def to_dict(self, user_names=None):
         # Get user name
-        user = User.query.get(self.user_id)
-        user_name = user.username if user else 'Unknown'
+        if user_names is not None:
+            user_name = user_names.get(self.user_id) or 'Unknown'
+        else:
+            user = User.query.get(self.user_id)
+            user_name = user.username if user else 'Unknown'
         
         return {
             'id': self.id,
@@ -224,9 +401,278 @@ class DealNote(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class DealDailyStats(db.Model):
+    """
+    Per-day, per-company deal rollup for time series (see src/utils/deal_stats.py):
+    new deals and their ARR on the creation day, won deals and revenue on the win day
+    """
+    __tablename__ = 'deal_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)  # UTC
+    company_id = db.Column(db.Integer, primary_key=True)
+    new_deals = db.Column(db.Integer, nullable=False, default=0)
+    new_pipeline_arr = db.Column(db.Float, nullable=False, default=0.0)  # revenue_arr of new deals
+    won_deals = db.Column(db.Integer, nullable=False, default=0)
+    won_revenue = db.Column(db.Float, nullable=False, default=0.0)  # revenue_actual or revenue_arr
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_deal_daily_stats_company_day', 'company_id', 'day'),
+    )
+
+class DealStatusEvent(db.Model):
+    """Append-only log of deal status transitions, written by triggers on deals"""
+    __tablename__ = 'deal_status_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    deal_id = db.Column(db.Integer, nullable=False)  # No FK: history outlives deleted deals
+    company_id = db.Column(db.Integer, nullable=False)
+    from_status = db.Column(db.String(50), nullable=True)  # None when the deal was created
+    to_status = db.Column(db.String(50), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_deal_status_events_deal_changed_at', 'deal_id', 'changed_at'),
+        db.Index('ix_deal_status_events_changed_at', 'changed_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'deal_id': self.deal_id,
+            'company_id': self.company_id,
+            'from_status': self.from_status,
+            'to_status': self.to_status,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None
+        }
+
+def status_event_trigger_ddl():
+    """
+    Triggers appending to deal_status_events on deal creation and on every
+    status change, in the writing transaction (covers the ORM and Core paths).
+    The ORM sets updated_at on every update; other writers get the current time.
+    """
+    columns = 'deal_id, company_id, from_status, to_status, changed_at'
+    yield ('CREATE TRIGGER IF NOT EXISTS deal_status_events_insert AFTER INSERT ON deals BEGIN '
+           f'INSERT INTO deal_status_events ({columns}) '
+           'VALUES (NEW.id, NEW.company_id, NULL, NEW.status, COALESCE(NEW.created_at, CURRENT_TIMESTAMP)); END')
+    yield ('CREATE TRIGGER IF NOT EXISTS deal_status_events_update AFTER UPDATE OF status ON deals '
+           'WHEN OLD.status IS NOT NEW.status BEGIN '
+           f'INSERT INTO deal_status_events ({columns}) '
+           'VALUES (NEW.id, NEW.company_id, OLD.status, NEW.status, '
+           'CASE WHEN NEW.updated_at IS NOT OLD.updated_at THEN NEW.updated_at ELSE CURRENT_TIMESTAMP END); END')
+
+def create_status_event_triggers(conn):
+    for ddl in status_event_trigger_ddl():
+        conn.exec_driver_sql(ddl)
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_status_event_triggers(metadata, connection, **kw):
+    create_status_event_triggers(connection)
+
+class DealFunnelDaily(db.Model):
+    """Deals first reaching each stage per day and company (see src/utils/deal_funnel.py)"""
+    __tablename__ = 'deal_funnel_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    company_id = db.Column(db.Integer, primary_key=True)
+    stage = db.Column(db.String(50), primary_key=True)
+    entered = db.Column(db.Integer, nullable=False, default=0)
+
+class DealDurationDaily(db.Model):
+    """
+    Histogram of stage durations per day and company: time spent in a stage
+    (metric = the stage, counted on the day the deal left it) and creation to
+    win (metric = 'win_cycle', counted on the win day)
+    """
+    __tablename__ = 'deal_duration_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    company_id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)  # Index into DURATION_BUCKETS_HOURS
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+class DealFunnelDay(db.Model):
+    """Days whose funnel snapshot rows have been written"""
+    __tablename__ = 'deal_funnel_days'
+    
+    day = db.Column(db.Date, primary_key=True)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncChange(db.Model):
+    """Latest change of each row of a synced table, written by triggers (see SYNC_TABLES)"""
+    __tablename__ = 'sync_changes'
+    
+    entity = db.Column(db.String(20), primary_key=True)  # Table name
+    entity_id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)  # Global, increases with every change
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    company_id = db.Column(db.Integer, nullable=True)  # Company the row belonged to, for scoping tombstones
+    
+    __table_args__ = (
+        db.Index('ix_sync_changes_seq', 'seq', unique=True),
+    )
+
+# Tables tracked in sync_changes, with the SQL for a row's company ({row} is NEW, OLD or the table)
+SYNC_TABLES = {
+    'deals': '{row}.company_id',
+    'companies': '{row}.id',
+    'deal_notes': '(SELECT company_id FROM deals WHERE deals.id = {row}.deal_id)',
+    'users': 'NULL',
+    'targets': 'NULL',
+}
+
+def _relog_company_sql(company_id):
+    """
+    INSERT re-logging a company with its deals and notes as changed. The max
+    seq is read once, before any row is inserted, so the new seqs are distinct.
+    """
+    return (
+        'INSERT OR REPLACE INTO sync_changes (entity, entity_id, seq, deleted, company_id) '
+        'SELECT entity, entity_id, (SELECT COALESCE(MAX(seq), 0) FROM sync_changes) '
+        '+ ROW_NUMBER() OVER (ORDER BY position, entity_id), 0, company_id FROM ('
+        f"SELECT 0 AS position, 'companies' AS entity, id AS entity_id, id AS company_id "
+        f'FROM companies WHERE id = {company_id} '
+        f"UNION ALL SELECT 1, 'deals', id, company_id FROM deals WHERE company_id = {company_id} "
+        "UNION ALL SELECT 2, 'deal_notes', deal_notes.id, deals.company_id FROM deal_notes "
+        f'JOIN deals ON deals.id = deal_notes.deal_id WHERE deals.company_id = {company_id})'
+    )
+
+def sync_trigger_ddl():
+    """
+    CREATE TRIGGER statements recording every insert, update and delete on
+    SYNC_TABLES in sync_changes, inside the writing transaction. Each change
+    takes the next sequence number and replaces the row's previous entry, so
+    the log holds one entry per row and deletes leave a tombstone.
+
+    A change to pam_company_assignments changes who may see a company, so it
+    re-logs the company with its deals and notes: a PAM who gained access
+    syncs them, one who lost it gets them back as tombstones (see
+    src/utils/sync.py).
+    """
+    next_seq = '(SELECT COALESCE(MAX(seq), 0) + 1 FROM sync_changes)'
+    for table, company_sql in SYNC_TABLES.items():
+        for operation, row, deleted in (('INSERT', 'NEW', 0), ('UPDATE', 'NEW', 0), ('DELETE', 'OLD', 1)):
+            yield (
+                f'CREATE TRIGGER IF NOT EXISTS sync_{table}_{operation.lower()} AFTER {operation} ON {table} '
+                f'BEGIN INSERT OR REPLACE INTO sync_changes (entity, entity_id, seq, deleted, company_id) '
+                f"VALUES ('{table}', {row}.id, {next_seq}, {deleted}, {company_sql.format(row=row)}); END"
+            )
+    for operation, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS sync_pam_company_assignments_{operation.lower()} '
+            f'AFTER {operation} ON pam_company_assignments BEGIN '
+            + ''.join(f'{_relog_company_sql(f"{row}.company_id")}; ' for row in rows) + 'END'
+        )
+
+def create_sync_triggers(conn):
+    for ddl in sync_trigger_ddl():
+        conn.exec_driver_sql(ddl)
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_sync_triggers(metadata, connection, **kw):
+    # create_all builds a new database in one go; migrations call create_sync_triggers themselves
+    create_sync_triggers(connection)
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+IN_QUERY_CHUNK_SIZE = 500
+
+def _chunked(values, size=IN_QUERY_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def load_names(model, ids, attr):
+    """Resolve {id: getattr(row, attr)} for the given ids with one IN-query per chunk"""
+    ids = {i for i in ids if i is not None}
+    names = {}
+    column = getattr(model, attr)
+    for chunk in _chunked(ids):
+        names.update(db.session.query(model.id, column).filter(model.id.in_(chunk)).all())
+    return names
+
+def load_assigned_company_ids(pam_ids):
+    """Resolve {pam_id: [company_id, ...]} from pam_company_assignments in one pass"""
+    assigned = {}
+    for chunk in _chunked({i for i in pam_ids if i is not None}):
+        rows = db.session.query(
+            pam_company_assignments.c.pam_id, pam_company_assignments.c.company_id
+        ).filter(pam_company_assignments.c.pam_id.in_(chunk)).all()
+        for pam_id, company_id in rows:
+            assigned.setdefault(pam_id, []).append(company_id)
+    return assigned
+
+def serialize_users(users):
+    """Serialize users with related names prefetched instead of queried per row"""
+    company_names = load_names(Company, (u.company_id for u in users), 'name')
+    assigned_company_map = load_assigned_company_ids(u.id for u in users if u.role == 'PAM')
+    return [u.to_dict(company_names=company_names, assigned_company_map=assigned_company_map)
+            for u in users]
+
+def serialize_companies(companies):
+    """Serialize companies with PAM names prefetched instead of queried per row"""
+    user_names = load_names(User, (c.pam_id for c in companies), 'username')
+    return [c.to_dict(user_names=user_names) for c in companies]
+
+def serialize_deals(deals):
+    """Serialize deals with partner company names prefetched instead of queried per row"""
+    company_names = load_names(Company, (d.company_id for d in deals), 'name')
+    return [d.to_dict(company_names=company_names) for d in deals]
+
+def serialize_targets(targets):
+    """Serialize targets with entity names prefetched instead of queried per row"""
+    user_names = load_names(
+        User, (t.target_entity_id for t in targets if t.target_type in ('PAM', 'SPOC')), 'username')
+    company_names = load_names(
+        Company, (t.target_entity_id for t in targets if t.target_type == 'Company'), 'name')
+    return [t.to_dict(user_names=user_names, company_names=company_names) for t in targets]
+
+def serialize_payouts(payouts):
+    """Serialize payouts with company names and deal customers prefetched instead of queried per row"""
+    company_names = load_names(Company, (p.company_id for p in payouts), 'name')
+    customer_companies = load_names(Deal, (p.deal_id for p in payouts), 'customer_company')
+    return [p.to_dict(company_names=company_names, customer_companies=customer_companies)
+            for p in payouts]
+
+def serialize_deal_notes(notes):
+    """Serialize deal notes with author names prefetched instead of queried per row"""
+    user_names = load_names(User, (n.user_id for n in notes), 'username')
+    return [n.to_dict(user_names=user_names) for n in notes]
+
+def ensure_indexes():
+    """
+    Create any declared index missing from an existing database (create_all skips existing tables).
+
+    Safe to run against a live database: each index is built in its own short
+    transaction, so under WAL readers carry on and writers only wait (up to the
+    busy timeout) for one index at a time. Returns the names of the indexes created.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            with db.engine.begin() as conn:
+                index.create(bind=conn, checkfirst=True)
+            created.append(index.name)
+    if created:
+        # Refresh planner statistics so the new indexes are picked up
+        with db.engine.begin() as conn:
+            conn.execute(db.text('PRAGMA optimize'))
+    return created
+
 def init_db():
     """Initialize database and create default admin user"""
-    db.create_all()
+    # Create or upgrade the schema (a no-op read of schema_version when current)
+    from src.models.migrations import migrate
+    migrate()
     
     try:
         # Check if admin user exists
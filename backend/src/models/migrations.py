@@ -0,0 +1,338 @@
+"""
+Versioned schema migrations
+
+The schema version lives in a single-row schema_version table. On startup
+migrate() reads that row and returns immediately when it is current, so an
+up-to-date database costs one primary-key lookup. Otherwise each pending
+migration is applied in order:
+
+  1. upgrade(conn) runs in one transaction together with the version bump
+     (when there is no further step), so a failed migration leaves nothing
+     half-applied.
+  2. backfill runs in id-range batches, each in its own short transaction,
+     so the write lock is never held for long on a large table.
+  3. indexes are built one per transaction (CREATE INDEX IF NOT EXISTS);
+     under WAL readers carry on while each one builds.
+
+The version is bumped only after all steps finish. Every step is idempotent
+(columns, tables and indexes are checked first, backfills only touch rows that
+still need it), so an interrupted migration is simply re-run.
+
+A brand-new database is created from the models in one transaction and
+stamped with the latest version without running any migration.
+"""
+import os
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.database import (db, Deal, CompanyDealStats, DealDailyStats, SYNC_TABLES,
+                                 create_sync_triggers, create_status_event_triggers)
+from src.models.search_index import create_search_indexes
+
+BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '5000'))
+
+schema_version = db.Table('schema_version',
+    db.Column('id', db.Integer, primary_key=True),  # Always 1
+    db.Column('version', db.Integer, nullable=False),
+    db.Column('updated_at', db.DateTime)
+)
+
+class Backfill:
+    """Apply step(conn, low_id, high_id) over table's id range in batches"""
+    def __init__(self, table, step):
+        self.table = table
+        self.step = step
+
+class Migration:
+    def __init__(self, version, description, upgrade=None, backfill=None, indexes=()):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        # One Backfill or a list of them
+        self.backfills = list(backfill) if isinstance(backfill, (list, tuple)) else [backfill] if backfill else []
+        self.indexes = indexes
+
+def _columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({table})')}
+
+def add_columns(conn, table, columns):
+    """ALTER TABLE ... ADD COLUMN for each {name: ddl} not already present"""
+    existing = _columns(conn, table)
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}')
+
+def create_tables(*names):
+    """Upgrade step creating the named model tables (with their indexes) if missing"""
+    def upgrade(conn):
+        for name in names:
+            db.metadata.tables[name].create(conn, checkfirst=True)
+    return upgrade
+
+# Migration steps
+
+def _legacy_schema(conn):
+    """What migrate_database.py, migrate_add_company_fields.py,
+    migrate_add_payout_percentage.py and migrate_pam_multi_company.py did"""
+    create_tables('companies', 'users', 'deals', 'targets', 'deal_notes', 'pam_company_assignments')(conn)
+    add_columns(conn, 'users', {
+        'phone_number': 'VARCHAR(50)',
+        'photo_url': 'VARCHAR(500)',
+    })
+    add_columns(conn, 'companies', {
+        'company_type': "VARCHAR(50) DEFAULT 'Partner'",
+        'website': 'VARCHAR(255)',
+        'contact_email': 'VARCHAR(120)',
+        'contact_phone': 'VARCHAR(50)',
+        'logo_url': 'VARCHAR(500)',
+        'spoc_name': 'VARCHAR(100)',
+        'spoc_email': 'VARCHAR(120)',
+        'spoc_phone': 'VARCHAR(50)',
+        'country': 'VARCHAR(100)',
+        'serving_regions': 'VARCHAR(500)',
+        'partner_stage': "VARCHAR(50) DEFAULT 'Registered'",
+        'published': 'BOOLEAN DEFAULT 0',
+        'tags': 'VARCHAR(500)',
+        'pam_id': 'INTEGER REFERENCES users(id)',
+        'payout_percentage': 'FLOAT DEFAULT 0.0',
+    })
+    add_columns(conn, 'deals', {
+        'revenue_actual': 'FLOAT',
+        'proof_of_engagement': 'VARCHAR(500)',
+        'proof_of_sale': 'VARCHAR(500)',
+    })
+    add_columns(conn, 'targets', {
+        'description': "VARCHAR(500) DEFAULT ''",
+    })
+
+def _backfill_pam_assignments(conn, low, high):
+    """Copy companies.pam_id into the many-to-many table for companies with no assignment yet"""
+    conn.execute(text(
+        'INSERT OR IGNORE INTO pam_company_assignments (pam_id, company_id, assigned_at) '
+        'SELECT pam_id, id, CURRENT_TIMESTAMP FROM companies '
+        'WHERE pam_id IS NOT NULL AND id BETWEEN :low AND :high '
+        'AND NOT EXISTS (SELECT 1 FROM pam_company_assignments a WHERE a.company_id = companies.id)'
+    ), {'low': low, 'high': high})
+
+def _add_token_version(conn):
+    add_columns(conn, 'users', {'token_version': 'INTEGER NOT NULL DEFAULT 0'})
+
+def _backfill_company_deal_stats(conn, low, high):
+    """Build rollup rows for companies low..high from their deals"""
+    from src.utils.deal_stats import STATS_FIELDS, deal_stats_columns
+    select_stats = db.select(Deal.company_id, *deal_stats_columns(), func.datetime('now')) \
+        .where(Deal.company_id.between(low, high)) \
+        .group_by(Deal.company_id)
+    conn.execute(sqlite_insert(CompanyDealStats).prefix_with('OR REPLACE').from_select(
+        ['company_id', *STATS_FIELDS, 'updated_at'], select_stats))
+
+def _add_updated_at(conn):
+    # SQLite cannot ADD COLUMN with a non-constant default; rows are backfilled below
+    for table in ('users', 'companies', 'targets'):
+        add_columns(conn, table, {'updated_at': 'DATETIME'})
+
+def _backfill_updated_at(table):
+    def step(conn, low, high):
+        conn.execute(text(
+            f'UPDATE {table} SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) '
+            'WHERE updated_at IS NULL AND id BETWEEN :low AND :high'
+        ), {'low': low, 'high': high})
+    return Backfill(table, step)
+
+def _add_sync_log(conn):
+    create_tables('sync_changes')(conn)
+    create_sync_triggers(conn)
+
+def _backfill_sync_log(table):
+    """Give rows written before the triggers existed an entry, so a first sync returns them"""
+    def step(conn, low, high):
+        # The max is read once, before any row is inserted, so the new seqs are distinct
+        conn.execute(text(
+            'INSERT OR IGNORE INTO sync_changes (entity, entity_id, seq, deleted, company_id) '
+            f"SELECT '{table}', id, (SELECT COALESCE(MAX(seq), 0) FROM sync_changes) + ROW_NUMBER() OVER (ORDER BY id), "
+            f'0, {SYNC_TABLES[table].format(row=table)} '
+            f'FROM {table} WHERE id BETWEEN :low AND :high'
+        ), {'low': low, 'high': high})
+    return Backfill(table, step)
+
+def _backfill_company_facets(conn, low, high):
+    """Index the tags and serving regions of companies low..high"""
+    from src.utils.company_facets import index_company_facets
+    rows = conn.execute(text(
+        'SELECT id, tags, serving_regions FROM companies WHERE id BETWEEN :low AND :high'
+    ), {'low': low, 'high': high}).all()
+    index_company_facets(rows, conn)
+
+def _add_status_events(conn):
+    create_tables('deal_status_events', 'deal_funnel_daily', 'deal_duration_daily', 'deal_funnel_days')(conn)
+    create_status_event_triggers(conn)
+
+def _backfill_status_events(conn, low, high):
+    """
+    Seed the history of deals created before the log existed: creation at
+    created_at and, for deals past Open, one move to their current status at
+    updated_at (intermediate steps were never recorded)
+    """
+    missing = 'id BETWEEN :low AND :high AND NOT EXISTS (SELECT 1 FROM deal_status_events e WHERE e.deal_id = deals.id)'
+    conn.execute(text(
+        'INSERT INTO deal_status_events (deal_id, company_id, from_status, to_status, changed_at) '
+        "SELECT id, company_id, NULL, 'Open', COALESCE(created_at, CURRENT_TIMESTAMP) FROM deals WHERE " + missing + ' '
+        'UNION ALL '
+        "SELECT id, company_id, 'Open', status, COALESCE(updated_at, created_at, CURRENT_TIMESTAMP) FROM deals "
+        "WHERE status IS NOT NULL AND status != 'Open' AND " + missing
+    ), {'low': low, 'high': high})
+
+def _add_deal_daily_stats(conn):
+    add_columns(conn, 'deals', {'won_at': 'DATETIME'})
+    create_tables('deal_daily_stats')(conn)
+
+def _backfill_won_at(conn, low, high):
+    """Date won deals by their last move to Won in the status log, else by updated_at"""
+    conn.execute(text(
+        'UPDATE deals SET won_at = COALESCE('
+        "(SELECT MAX(e.changed_at) FROM deal_status_events e WHERE e.deal_id = deals.id AND e.to_status = 'Won'), "
+        'updated_at, created_at) '
+        "WHERE status = 'Won' AND won_at IS NULL AND id BETWEEN :low AND :high"
+    ), {'low': low, 'high': high})
+
+def _backfill_deal_daily_stats(conn, low, high):
+    """Build daily rollup rows for companies low..high from their deals"""
+    from src.utils.deal_stats import DAILY_FIELDS, deal_daily_stats_select
+    stats = deal_daily_stats_select(Deal.company_id.between(low, high)).subquery()
+    conn.execute(sqlite_insert(DealDailyStats).prefix_with('OR REPLACE').from_select(
+        ['day', 'company_id', *DAILY_FIELDS, 'updated_at'], db.select(*stats.c, func.datetime('now'))))
+
+def _add_search_indexes(conn):
+    # FTS5 builds the index from the content tables in one pass; it runs with
+    # the triggers' creation so no write can slip in between
+    create_search_indexes(conn, rebuild=True)
+
+MIGRATIONS = [
+    Migration(1, 'Columns and tables from the legacy migrate_*.py scripts',
+              upgrade=_legacy_schema,
+              backfill=Backfill('companies', _backfill_pam_assignments)),
+    Migration(2, 'users.token_version for token revocation',
+              upgrade=_add_token_version),
+    Migration(3, 'company_deal_stats rollup',
+              upgrade=create_tables('company_deal_stats'),
+              backfill=Backfill('companies', _backfill_company_deal_stats)),
+    Migration(4, 'Payout ledger tables',
+              upgrade=create_tables('payout_runs', 'payouts')),
+    Migration(5, 'Keyset pagination indexes on deals',
+              indexes=('ix_deals_created_at_id', 'ix_deals_updated_at_id', 'ix_deals_company_created_at_id',
+                       'ix_deals_status_created_at_id', 'ix_deals_status_updated_at_id')),
+    Migration(6, 'Indexes for filtered and duplicate-check lookups',
+              indexes=('ix_deals_company_status', 'ix_deal_notes_deal_created_at', 'ix_targets_type_entity',
+                       'ix_users_role', 'ix_users_company_id', 'ix_companies_pam_id',
+                       'ix_companies_contact_email', 'ix_companies_spoc_email', 'ix_companies_website',
+                       'ix_payouts_run_id', 'ix_pam_company_assignments_company_id')),
+    Migration(7, 'updated_at on users, companies and targets',
+              upgrade=_add_updated_at,
+              backfill=[_backfill_updated_at(table) for table in ('users', 'companies', 'targets')]),
+    Migration(8, 'sync_changes log and triggers for delta sync',
+              upgrade=_add_sync_log,
+              backfill=[_backfill_sync_log(table) for table in SYNC_TABLES]),
+    Migration(9, 'FTS5 search indexes over deals and deal notes',
+              upgrade=_add_search_indexes),
+    Migration(10, 'company_tags and company_regions facet indexes',
+              upgrade=create_tables('company_tags', 'company_regions'),
+              backfill=Backfill('companies', _backfill_company_facets)),
+    Migration(11, 'Deal status event log and funnel snapshots',
+              upgrade=_add_status_events,
+              backfill=Backfill('deals', _backfill_status_events)),
+    Migration(12, 'deals.won_at and deal_daily_stats rollup for time series',
+              upgrade=_add_deal_daily_stats,
+              backfill=[Backfill('deals', _backfill_won_at),
+                        Backfill('companies', _backfill_deal_daily_stats)]),
+    Migration(13, 'Index on deals.won_at for period attainment',
+              indexes=('ix_deals_won_at',)),
+    Migration(14, 'Sync log triggers on PAM company assignments',
+              upgrade=create_sync_triggers),
+    Migration(15, 'Index on deals (company_id, updated_at, id) for archived pages by company',
+              indexes=('ix_deals_company_updated_at_id',)),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Runner
+
+def current_version(conn):
+    """The recorded schema version, or None if schema_version does not exist yet"""
+    try:
+        return conn.execute(text('SELECT version FROM schema_version WHERE id = 1')).scalar() or 0
+    except OperationalError:
+        conn.rollback()
+        return None
+
+def set_version(conn, version):
+    conn.execute(text(
+        'INSERT INTO schema_version (id, version, updated_at) VALUES (1, :version, CURRENT_TIMESTAMP) '
+        'ON CONFLICT (id) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at'
+    ), {'version': version})
+
+def _index(name):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f'Index {name} is not declared on any model')
+
+def run_backfill(engine, backfill, batch_size=BATCH_SIZE):
+    """Run a backfill over its table's id range, one transaction per batch"""
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f'SELECT MIN(id), MAX(id) FROM {backfill.table}')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch_size):
+        with engine.begin() as conn:
+            backfill.step(conn, start, start + batch_size - 1)
+
+def apply_migration(engine, migration):
+    """Apply one migration and record its version"""
+    with engine.begin() as conn:
+        if migration.upgrade:
+            migration.upgrade(conn)
+        if not migration.backfills and not migration.indexes:
+            set_version(conn, migration.version)
+            return
+    for backfill in migration.backfills:
+        run_backfill(engine, backfill)
+    for name in migration.indexes:
+        with engine.begin() as conn:
+            _index(name).create(conn, checkfirst=True)
+    with engine.begin() as conn:
+        set_version(conn, migration.version)
+
+def pending_migrations(version):
+    return [m for m in MIGRATIONS if m.version > (version or 0)]
+
+def migrate(engine=None, log=print):
+    """Bring the database to LATEST_VERSION; returns the versions applied"""
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version == LATEST_VERSION:
+        return []
+
+    if version is None:
+        with engine.begin() as conn:
+            if not inspect(conn).has_table('users'):
+                # New database: build the current schema directly
+                db.metadata.create_all(conn)
+                set_version(conn, LATEST_VERSION)
+                log(f'Created schema at version {LATEST_VERSION}')
+                return []
+            # Database from before versioning: replay every (idempotent) migration
+            schema_version.create(conn, checkfirst=True)
+            set_version(conn, 0)
+
+    applied = []
+    for migration in pending_migrations(version):
+        log(f'Applying migration {migration.version}: {migration.description}')
+        apply_migration(engine, migration)
+        applied.append(migration.version)
+    if applied:
+        # Refresh planner statistics for new tables and indexes
+        with engine.begin() as conn:
+            conn.exec_driver_sql('PRAGMA optimize')
+    return applied
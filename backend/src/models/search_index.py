@@ -0,0 +1,48 @@
+"""
+FTS5 full-text indexes over deals and deal notes
+
+Each index is an external-content FTS5 table: it stores only the inverted
+index and reads the text back from the source table, so the text is not
+duplicated on disk. Triggers on the source table keep it in step within the
+writing transaction; updates only touch the index when an indexed column
+changes.
+"""
+from sqlalchemy import event
+from src.models.database import db
+
+# FTS table -> (source table, indexed columns)
+SEARCH_INDEXES = {
+    'deals_fts': ('deals', ('customer_company', 'customer_spoc', 'customer_spoc_email', 'comments')),
+    'deal_notes_fts': ('deal_notes', ('note_text',)),
+}
+
+# unicode61 folds case and accents; the prefix indexes make 2-3 character
+# prefix queries (type-ahead) index lookups instead of term scans
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+def search_index_ddl():
+    """CREATE statements for every FTS table and its sync triggers"""
+    for fts, (table, columns) in SEARCH_INDEXES.items():
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'NEW.{column}' for column in columns)
+        old_values = ', '.join(f'OLD.{column}' for column in columns)
+        insert_new = f'INSERT INTO {fts} (rowid, {column_list}) VALUES (NEW.id, {new_values});'
+        delete_old = f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', OLD.id, {old_values});"
+        yield (f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, '
+               f"content = '{table}', content_rowid = 'id', {FTS_OPTIONS})")
+        yield f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert_new} END'
+        yield f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete_old} END'
+        yield (f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} '
+               f'BEGIN {delete_old} {insert_new} END')
+
+def create_search_indexes(conn, rebuild=False):
+    """Create the FTS tables and triggers; rebuild=True (re)indexes every existing row"""
+    for ddl in search_index_ddl():
+        conn.exec_driver_sql(ddl)
+    if rebuild:
+        for fts in SEARCH_INDEXES:
+            conn.exec_driver_sql(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_indexes(metadata, connection, **kw):
+    create_search_indexes(connection)
@@ -2,71 +2,101 @@
 Analytics routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, Deal, Company, User
+from src.models.database import db, Deal, Company, User, CompanyDealStats, split_list
+from src.utils.pagination import date_range_clauses
+from src.utils.deal_stats import deal_stats_columns
+from src.utils.cache import cached_response, result_cache
+from src.utils.streaming import csv_response, iter_cursor_batches, wants_gzip
+from src.utils.company_facets import filter_companies
+from src.utils.deal_funnel import funnel_report
+from src.utils.deal_timeseries import deal_timeseries
 from sqlalchemy import func
+from sqlalchemy.orm import aliased
 
 bp = Blueprint('analytics', __name__)
 
+def partner_performance_query(args):
+    """
+    Per-partner metrics, one row per company ordered by id.
+
+    Deal counts and won revenue are read from the company_deal_stats rollup,
+    joined to companies and their PAM in one statement. A date range
+    (date_from/date_to on deal created_at) cannot use the all-time rollup, so
+    it falls back to one GROUP BY over the matching deals. Other optional
+    filters: company_id and the company filters (tag, region, partner_stage, ...)
+    of src/utils/company_facets.py.
+    """
+    date_clauses = date_range_clauses(Deal.created_at, args.get('date_from'), args.get('date_to'))
+    if date_clauses:
+        deal_stats = db.session.query(Deal.company_id.label('company_id'), *deal_stats_columns())
+        for clause in date_clauses:
+            deal_stats = deal_stats.filter(clause)
+        deal_stats = deal_stats.group_by(Deal.company_id).subquery()
+    else:
+        deal_stats = CompanyDealStats.__table__
+    
+    pam = aliased(User)
+    query = db.session.query(
+        Company.id.label('company_id'),
+        Company.name.label('company_name'),
+        pam.username.label('pam_name'),
+        func.coalesce(deal_stats.c.total_deals, 0).label('total_deals'),
+        func.coalesce(deal_stats.c.won_deals, 0).label('won_deals'),
+        func.coalesce(deal_stats.c.won_revenue, 0).label('total_revenue'),
+        Company.tags.label('tags')
+    ).outerjoin(deal_stats, deal_stats.c.company_id == Company.id) \
+     .outerjoin(pam, pam.id == Company.pam_id)
+    
+    if args.get('company_id'):
+        query = query.filter(Company.id == int(args['company_id']))
+    return filter_companies(query, args).order_by(Company.id)
+
 @bp.route('/partner-performance', methods=['GET'])
+@cached_response()
 def get_partner_performance():
-    """Get performance metrics for all partners"""
+    """Get performance metrics for all partners (filters: see partner_performance_query)"""
     try:
-        # Get all companies
-        companies = Company.query.all()
-        
-        performance_data = []
-        
-        for company in companies:
-            # Count total deals
-            total_deals = Deal.query.filter_by(company_id=company.id).count()
-            
-            # Count won deals
-            won_deals = Deal.query.filter_by(company_id=company.id, status='Won').count()
-            
-            # Calculate total revenue from won deals
-            won_deals_list = Deal.query.filter_by(company_id=company.id, status='Won').all()
-            total_revenue = sum([deal.revenue_actual or deal.revenue_arr for deal in won_deals_list])
-            
-            # Get PAM name if assigned
-            pam_name = None
-            if company.pam_id:
-                pam = User.query.get(company.pam_id)
-                pam_name = pam.username if pam else None
-            
-            performance_data.append({
-                'company_id': company.id,
-                'company_name': company.name,
-                'pam_name': pam_name,
-                'total_deals': total_deals,
-                'won_deals': won_deals,
-                'total_revenue': total_revenue,
-                'tags': company.tags.split(',') if company.tags else []
-            })
+        performance_data = [{
+            **row._asdict(),
+            'tags': split_list(row.tags)
+        } for row in partner_performance_query(request.args).all()]
         
         return jsonify(performance_data), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/partner-performance/export.csv', methods=['GET'])
+def export_partner_performance_csv():
+    """Stream partner performance as CSV (?gzip=1 for partner-performance.csv.gz); same filters"""
+    try:
+        query = partner_performance_query(request.args)
+        header = [column['name'] for column in query.column_descriptions]
+        return csv_response(iter_cursor_batches(query), header, 'partner-performance.csv',
+                            compress=wants_gzip(request))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/dashboard-stats', methods=['GET'])
+@cached_response()
 def get_dashboard_stats():
     """Get overall dashboard statistics"""
     try:
         # Total companies
         total_companies = Company.query.count()
         
-        # Total deals
-        total_deals = Deal.query.count()
-        
-        # Won deals
-        won_deals = Deal.query.filter_by(status='Won').count()
-        
-        # Total revenue from won deals
-        won_deals_list = Deal.query.filter_by(status='Won').all()
-        total_revenue = sum([deal.revenue_actual or deal.revenue_arr for deal in won_deals_list])
-        
-        # Active deals (Open + In Progress)
-        active_deals = Deal.query.filter(Deal.status.in_(['Open', 'In Progress'])).count()
+        # Deal totals summed over the per-company rollup rows
+        total_deals, won_deals, total_revenue, active_deals = db.session.query(
+            func.coalesce(func.sum(CompanyDealStats.total_deals), 0),
+            func.coalesce(func.sum(CompanyDealStats.won_deals), 0),
+            func.coalesce(func.sum(CompanyDealStats.won_revenue), 0),
+            # Active deals (Open + In Progress)
+            func.coalesce(func.sum(CompanyDealStats.open_deals + CompanyDealStats.in_progress_deals), 0)
+        ).one()
         
         return jsonify({
             'total_companies': total_companies,
@@ -79,3 +109,31 @@ def get_dashboard_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/timeseries', methods=['GET'])
+@cached_response()
+def get_deal_timeseries():
+    """Won revenue, new pipeline ARR and deal counts per period (filters: see deal_timeseries)"""
+    try:
+        return jsonify(deal_timeseries(request.args)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/funnel', methods=['GET'])
+@cached_response()
+def get_deal_funnel():
+    """Stage conversion, time in stage and win cycle per partner or PAM (filters: see funnel_report)"""
+    try:
+        return jsonify(funnel_report(request.args)), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit/miss counters for the analytics result cache"""
+    return jsonify(result_cache.stats()), 200
@@ -3,14 +3,13 @@ Authentication routes
 """
 from flask import Blueprint, request, jsonify
 from src.models.database import db, User
+from src.utils.permissions import SECRET_KEY
+from src.utils.passwords import PasswordHasherBusy
 import jwt
-import os
 from datetime import datetime, timedelta
 
 bp = Blueprint('auth', __name__)
 
-SECRET_KEY = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
-
 @bp.route('/login', methods=['POST'])
 def login():
     """User login endpoint"""
@@ -27,12 +26,18 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes stored at an outdated bcrypt cost while we have the password
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        
         # Generate JWT token
         token = jwt.encode({
             'user_id': user.id,
             'email': user.email,
             'role': user.role,
             'company_id': user.company_id,
+            'token_version': user.token_version or 0,
             'exp': datetime.utcnow() + timedelta(days=7)
         }, SECRET_KEY, algorithm='HS256')
         
@@ -41,6 +46,9 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2,16 +2,43 @@
 Companies management routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, Company
+from src.models.database import db, User, Company, pam_company_assignments, serialize_companies
+from src.utils.streaming import stream_format, stream_query
+from src.utils.rbac import scope_to_current_user, scope_companies_query
+from src.utils.company_onboarding import company_values, add_pam_assignments, onboard_companies
+from src.utils.deal_import import import_format, iter_rows
+from src.utils.etag import conditional_response, model_source
+from src.utils.company_facets import filter_companies, facet_counts, index_company_facets, remove_company_facets
 
 bp = Blueprint('companies', __name__)
 
 @bp.route('', methods=['GET'])
 def get_companies():
-    """Get all companies"""
+    """
+    Get all companies, optionally filtered (see filter_companies).
+    
+    ?facets=1 returns {'companies', 'facets'} with per-value counts for
+    each filter dimension over the matching companies.
+    """
     try:
-        companies = Company.query.all()
-        return jsonify([company.to_dict() for company in companies]), 200
+        query = scope_to_current_user(Company.query, scope_companies_query)
+        query = filter_companies(query, request.args)
+        
+        fmt = stream_format(request)
+        if fmt:
+            return stream_query(query, Company.id, serialize_companies, fmt)
+        
+        def build_response():
+            companies = serialize_companies(query.all())
+            if request.args.get('facets') in ('1', 'true'):
+                return jsonify({'companies': companies, 'facets': facet_counts(query)})
+            return jsonify(companies)
+        
+        # Rows embed their PAM's username
+        sources = [model_source(Company, query), model_source(User)]
+        return conditional_response(sources, build_response)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -41,51 +68,16 @@ def create_company():
         if data.get('website') and Company.query.filter_by(website=data['website']).first():
             return jsonify({'error': 'A company with this website already exists'}), 400
         
-        # Handle tags - convert array to comma-separated string
-        tags_str = ''
-        if 'tags' in data:
-            if isinstance(data['tags'], list):
-                tags_str = ','.join(data['tags'])
-            else:
-                tags_str = data['tags']
-        
-        company = Company(
-            name=data['name'],
-            company_type=data.get('company_type', 'Partner'),
-            website=data.get('website'),
-            contact_email=data.get('contact_email') or data.get('email'),  # Support both field names
-            contact_phone=data.get('contact_phone') or data.get('phone_number'),  # Support both field names
-            logo_url=data.get('logo_url'),
-            spoc_name=data.get('spoc_name'),
-            spoc_email=data.get('spoc_email'),
-            spoc_phone=data.get('spoc_phone'),
-            country=data.get('country'),
-            serving_regions=data.get('serving_regions'),
-            partner_stage=data.get('partner_stage', 'Registered'),
-            published=data.get('published') or data.get('published_on_website', False),  # Support both field names
-            tags=tags_str,
-            pam_id=data.get('pam_id') or data.get('assigned_pam_id'),  # Support both field names
-            payout_percentage=float(data.get('payout_percentage', 0.0))
-        )
-        
+        company = Company(**company_values(data))
         db.session.add(company)
-        db.session.commit()
+        db.session.flush()
         
-        # Sync PAM assignment if PAM is assigned
+        # Sync PAM assignment and the tag/region index in the same transaction
         if company.pam_id:
-            from src.models.database import PAMCompanyAssignment
-            # Check if assignment already exists
-            existing = PAMCompanyAssignment.query.filter_by(
-                pam_id=company.pam_id,
-                company_id=company.id
-            ).first()
-            if not existing:
-                assignment = PAMCompanyAssignment(
-                    pam_id=company.pam_id,
-                    company_id=company.id
-                )
-                db.session.add(assignment)
-                db.session.commit()
+            add_pam_assignments([(company.pam_id, company.id)])
+        index_company_facets([(company.id, company.tags, company.serving_regions)])
+        
+        db.session.commit()
         
         return jsonify({
             'message': 'Company created successfully',
@@ -96,6 +88,39 @@ def create_company():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/bulk', methods=['POST'])
+def bulk_onboard_companies():
+    """
+    Onboard many companies at once.
+
+    Accepts a JSON array (or {"companies": [...]}) of POST /api/companies
+    payloads, or a CSV / NDJSON upload with the same fields. Duplicates -
+    against existing companies or earlier rows - are rejected per row; the
+    rest are inserted with their PAM assignments in one transaction.
+    Responds 201 if any company was created, else 400.
+    """
+    try:
+        if request.is_json:
+            data = request.get_json()
+            rows = data.get('companies') if isinstance(data, dict) else data
+            if not isinstance(rows, list):
+                return jsonify({'error': 'Expected a list of companies'}), 400
+            numbered_rows = enumerate(rows, start=1)
+        else:
+            upload = request.files.get('file')
+            numbered_rows = iter_rows(upload.stream if upload else request.stream, import_format(request))
+        
+        result = onboard_companies(numbered_rows)
+        db.session.commit()
+        return jsonify(result), 201 if result['created'] else 400
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/<int:company_id>', methods=['PUT'])
 def update_company(company_id):
     """Update a company"""
@@ -158,27 +183,17 @@ def update_company(company_id):
             
             # Sync PAM assignment
             if new_pam_id != old_pam_id:
-                from src.models.database import PAMCompanyAssignment
-                # Remove old assignment if exists
                 if old_pam_id:
-                    PAMCompanyAssignment.query.filter_by(
-                        pam_id=old_pam_id,
-                        company_id=company.id
-                    ).delete()
-                # Add new assignment if PAM is assigned
+                    db.session.execute(pam_company_assignments.delete().where(
+                        pam_company_assignments.c.pam_id == old_pam_id,
+                        pam_company_assignments.c.company_id == company.id
+                    ))
                 if new_pam_id:
-                    existing = PAMCompanyAssignment.query.filter_by(
-                        pam_id=new_pam_id,
-                        company_id=company.id
-                    ).first()
-                    if not existing:
-                        assignment = PAMCompanyAssignment(
-                            pam_id=new_pam_id,
-                            company_id=company.id
-                        )
-                        db.session.add(assignment)
+                    add_pam_assignments([(new_pam_id, company.id)])
         if 'payout_percentage' in data:
             company.payout_percentage = float(data['payout_percentage'])
+        if 'tags' in data or 'serving_regions' in data:
+            index_company_facets([(company.id, company.tags, company.serving_regions)])
         
         db.session.commit()
         
@@ -199,6 +214,7 @@ def delete_company(company_id):
         if not company:
             return jsonify({'error': 'Company not found'}), 404
         
+        remove_company_facets(company.id)
         db.session.delete(company)
         db.session.commit()
         
@@ -2,16 +2,181 @@
 Deals management routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, Deal, Company, DealNote, User
+from src.models.database import db, Deal, Company, DealNote, User, serialize_deals, serialize_deal_notes
+from src.utils.pagination import wants_pagination, parse_limit, date_range_clauses, keyset_page
+from src.utils.streaming import stream_format, stream_query, stream_csv_export
+from src.utils.deal_stats import snapshot_deal, record_deal_change
+from src.utils.rbac import scope_to_current_user, scope_deals_query, scope_companies_query
+from src.utils.deal_import import import_format, iter_rows, import_deals
+from src.utils.etag import conditional_response, model_source
+from src.utils.deal_search import deal_matches
+from src.utils.payout_ledger import void_pending_payout
 
 bp = Blueprint('deals', __name__)
 
+# Columns deal lists sort by (?sort=) and date-filter on (?date_field=)
+DEAL_SORT_COLUMNS = {
+    'created_at': Deal.created_at,
+    'updated_at': Deal.updated_at,
+}
+
+def filter_deals(query, args):
+    """
+    Apply the optional company, status, revenue and date filters from the query string.
+
+    date_from/date_to apply to ?date_field= (created_at by default, or
+    updated_at), whatever the sort order.
+    """
+    if args.get('company_id'):
+        try:
+            company_id = int(args['company_id'])
+        except ValueError:
+            raise ValueError('company_id must be an integer')
+        query = query.filter(Deal.company_id == company_id)
+    
+    if args.get('status'):
+        statuses = [s.strip() for s in args['status'].split(',') if s.strip()]
+        query = query.filter(Deal.status.in_(statuses))
+    
+    for param, op in (('min_revenue', '__ge__'), ('max_revenue', '__le__')):
+        if args.get(param):
+            try:
+                value = float(args[param])
+            except ValueError:
+                raise ValueError(f'{param} must be a number')
+            query = query.filter(getattr(Deal.revenue_arr, op)(value))
+    
+    date_field = args.get('date_field', 'created_at')
+    if date_field not in DEAL_SORT_COLUMNS:
+        raise ValueError(f'Invalid date_field. Valid values: {", ".join(DEAL_SORT_COLUMNS)}')
+    for clause in date_range_clauses(DEAL_SORT_COLUMNS[date_field], args.get('date_from'), args.get('date_to')):
+        query = query.filter(clause)
+    
+    return query
+
+def list_deals(query, default_sort='created_at'):
+    """
+    Filter, sort and optionally page a deal query.
+
+    Without ?limit= or ?cursor= the response stays a plain list. With them it
+    is {'deals', 'next_cursor', 'has_more'} (plus 'total' if ?include_total=1),
+    paged by (sort column, id) so every page is an index range scan.
+    date_from/date_to filter on ?date_field= (created_at unless given), not on
+    the sort column, so /archived (sorted by updated_at) filters like /export.csv.
+    ?stream= or an NDJSON Accept header streams every matching deal instead.
+    Responses carry an ETag, and a matching If-None-Match gets 304 without
+    loading any deals.
+    """
+    args = request.args
+    sort = args.get('sort', default_sort)
+    if sort not in DEAL_SORT_COLUMNS:
+        raise ValueError(f'Invalid sort. Valid values: {", ".join(DEAL_SORT_COLUMNS)}')
+    sort_column = DEAL_SORT_COLUMNS[sort]
+    
+    query = scope_to_current_user(query, scope_deals_query)
+    query = filter_deals(query, args)
+    
+    fmt = stream_format(request)
+    if fmt:
+        return stream_query(query, Deal.id, serialize_deals, fmt)
+    
+    def build_response():
+        if not wants_pagination(args):
+            return jsonify(serialize_deals(query.all()))
+        
+        limit = parse_limit(args)
+        descending = args.get('order', 'desc').lower() != 'asc'
+        
+        payload = {}
+        if args.get('include_total') in ('1', 'true'):
+            payload['total'] = query.count()
+        
+        deals, next_cursor = keyset_page(query, sort_column, Deal.id, limit,
+                                         cursor=args.get('cursor'), descending=descending)
+        payload.update({
+            'deals': serialize_deals(deals),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+        return jsonify(payload)
+    
+    # Rows embed their partner company's name
+    return conditional_response([model_source(Deal, query), model_source(Company)], build_response)
+
 @bp.route('', methods=['GET'])
 def get_deals():
     """Get all deals"""
     try:
-        deals = Deal.query.all()
-        return jsonify([deal.to_dict() for deal in deals]), 200
+        return list_deals(Deal.query)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def search_deals_query(args):
+    """(query of (deal_id, score) for ?q= with the list filters applied, the matches subquery)"""
+    matches = deal_matches(args.get('q'))
+    query = db.session.query(matches.c.deal_id, matches.c.score).join(Deal, Deal.id == matches.c.deal_id)
+    query = scope_to_current_user(query, scope_deals_query)
+    return filter_deals(query, args), matches
+
+@bp.route('/search', methods=['GET'])
+def search_deals():
+    """
+    Full-text search of deal fields and notes (?q=), best matches first.
+    
+    Takes the list filters and is paged like GET /api/deals?limit=:
+    {'deals', 'next_cursor', 'has_more'}.
+    """
+    try:
+        args = request.args
+        query, matches = search_deals_query(args)
+        page, next_cursor = keyset_page(query, matches.c.score, matches.c.deal_id, parse_limit(args),
+                                        cursor=args.get('cursor'), descending=False, parse_sort_value=float)
+        deals = {deal.id: deal for deal in Deal.query.filter(Deal.id.in_([row.deal_id for row in page]))}
+        return jsonify({
+            'deals': serialize_deals([deals[row.deal_id] for row in page]),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Columns of GET /api/deals/export.csv, in order
+DEAL_CSV_COLUMNS = [
+    ('id', Deal.id),
+    ('company_id', Deal.company_id),
+    ('partner_company_name', Company.name),
+    ('customer_company', Deal.customer_company),
+    ('customer_company_url', Deal.customer_company_url),
+    ('customer_spoc', Deal.customer_spoc),
+    ('customer_spoc_email', Deal.customer_spoc_email),
+    ('customer_spoc_phone', Deal.customer_spoc_phone),
+    ('revenue_arr', Deal.revenue_arr),
+    ('revenue_actual', Deal.revenue_actual),
+    ('status', Deal.status),
+    ('comments', Deal.comments),
+    ('created_at', Deal.created_at),
+    ('updated_at', Deal.updated_at),
+]
+
+@bp.route('/export.csv', methods=['GET'])
+def export_deals_csv():
+    """
+    Stream the deals visible to the caller as CSV (?gzip=1 for deals.csv.gz).
+
+    Takes the same filters as GET /api/deals (company_id, status,
+    min_revenue/max_revenue, date_from/date_to on ?date_field=).
+    """
+    try:
+        query = scope_to_current_user(Deal.query, scope_deals_query)
+        query = filter_deals(query, request.args)
+        query = query.outerjoin(Company, Company.id == Deal.company_id).order_by(Deal.id)
+        return stream_csv_export(request, query, DEAL_CSV_COLUMNS, 'deals.csv')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -41,6 +206,7 @@ def create_deal():
         )
         
         db.session.add(deal)
+        record_deal_change(None, snapshot_deal(deal))
         db.session.commit()
         
         return jsonify({
@@ -52,6 +218,34 @@ def create_deal():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/bulk', methods=['POST'])
+def bulk_import_deals():
+    """
+    Import many deals from a CSV or NDJSON upload.
+
+    Send the file as the request body (text/csv or application/x-ndjson) or
+    as a multipart 'file' field. Columns/keys are those of POST /api/deals.
+    Valid rows are inserted in chunks; invalid ones are returned with their
+    row number. Responds 201 if any row was imported, else 400.
+    """
+    try:
+        fmt = import_format(request)
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        
+        # Companies the caller may create deals for, loaded once for every row
+        company_ids = {company_id for (company_id,) in
+                       scope_to_current_user(db.session.query(Company.id), scope_companies_query)}
+        
+        result = import_deals(iter_rows(stream, fmt), company_ids)
+        return jsonify(result), 201 if result['inserted'] else 400
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/<int:deal_id>', methods=['PUT'])
 def update_deal(deal_id):
     """Update a deal"""
@@ -61,6 +255,8 @@ def update_deal(deal_id):
             return jsonify({'error': 'Deal not found'}), 404
         
         data = request.get_json()
+        before = snapshot_deal(deal)
+        was_won = deal.status == 'Won'
         
         # Update fields
         for field in ['customer_company', 'customer_company_url', 'customer_spoc',
@@ -69,6 +265,9 @@ def update_deal(deal_id):
             if field in data:
                 setattr(deal, field, data[field])
         
+        record_deal_change(before, snapshot_deal(deal))
+        if was_won and deal.status != 'Won':
+            void_pending_payout(deal.id)
         db.session.commit()
         
         return jsonify({
@@ -88,6 +287,10 @@ def delete_deal(deal_id):
         if not deal:
             return jsonify({'error': 'Deal not found'}), 404
         
+        record_deal_change(snapshot_deal(deal), None)
+        void_pending_payout(deal.id)
+        # Notes go first, while the deal exists, so their sync tombstones carry its company
+        DealNote.query.filter_by(deal_id=deal.id).delete(synchronize_session=False)
         db.session.delete(deal)
         db.session.commit()
         
@@ -101,8 +304,9 @@ def delete_deal(deal_id):
 def get_archived_deals():
     """Get archived deals"""
     try:
-        deals = Deal.query.filter(Deal.status.in_(['Won', 'Lost'])).all()
-        return jsonify([deal.to_dict() for deal in deals]), 200
+        return list_deals(Deal.query.filter(Deal.status.in_(['Won', 'Lost'])), default_sort='updated_at')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -111,7 +315,7 @@ def get_deal_notes(deal_id):
     """Get notes for a deal"""
     try:
         notes = DealNote.query.filter_by(deal_id=deal_id).order_by(DealNote.created_at.desc()).all()
-        return jsonify([note.to_dict() for note in notes]), 200
+        return jsonify(serialize_deal_notes(notes)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
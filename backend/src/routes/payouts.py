@@ -2,123 +2,228 @@
 Payouts management routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, Deal, User, Company
+from src.models.database import db, Deal, User, Company, CompanyDealStats, Payout, PayoutRun, serialize_payouts
+from src.utils.streaming import stream_format, stream_query, stream_csv_export
+from src.utils.pagination import wants_pagination, parse_limit, keyset_page
+from src.utils.payout_ledger import create_payout_run, set_payout_status, payout_totals, last_watermark
 from datetime import datetime
+from sqlalchemy.orm import aliased
 
 bp = Blueprint('payouts', __name__)
 
+def filter_payouts(query, args):
+    """Apply the optional status, company_id and run_id filters from the query string"""
+    if args.get('status'):
+        query = query.filter(Payout.status == args['status'])
+    if args.get('company_id'):
+        query = query.filter(Payout.company_id == int(args['company_id']))
+    if args.get('run_id'):
+        query = query.filter(Payout.run_id == int(args['run_id']))
+    return query
+
 @bp.route('', methods=['GET'])
 def get_payouts():
-    """Get all payouts (calculated from won deals)"""
+    """
+    Get stored payouts (written by payout runs).
+
+    Optional filters: status, company_id, run_id. ?limit=/?cursor= page by
+    (created_at, id) and ?stream= streams, as for the deal list endpoints.
+    """
     try:
-        # Get all won deals
-        won_deals = Deal.query.filter_by(status='Won').all()
-        
-        payouts = []
-        for deal in won_deals:
-            # Get company info
-            company = Company.query.get(deal.company_id)
-            if not company:
-                continue
-                
-            # Calculate payout using company-specific percentage
-            payout_percentage = (company.payout_percentage or 0.0) / 100.0
-            payout_amount = deal.revenue_arr * payout_percentage
-            
-            payouts.append({
-                'id': deal.id,
-                'deal_id': deal.id,
-                'company_id': deal.company_id,
-                'company_name': company.name,
-                'customer_company': deal.customer_company,
-                'revenue_arr': deal.revenue_arr,
-                'payout_amount': payout_amount,
-                'status': 'Pending',
-                'created_at': deal.created_at.isoformat() if deal.created_at else None
-            })
+        args = request.args
+        query = filter_payouts(Payout.query, args)
         
-        return jsonify(payouts), 200
+        fmt = stream_format(request)
+        if fmt:
+            return stream_query(query, Payout.id, serialize_payouts, fmt)
         
+        if not wants_pagination(args):
+            return jsonify(serialize_payouts(query.all())), 200
+        
+        payload = {}
+        if args.get('include_total') in ('1', 'true'):
+            payload['total'] = query.count()
+        payouts, next_cursor = keyset_page(query, Payout.created_at, Payout.id, parse_limit(args),
+                                           cursor=args.get('cursor'),
+                                           descending=args.get('order', 'desc').lower() != 'asc')
+        payload.update({
+            'payouts': serialize_payouts(payouts),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+        return jsonify(payload), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Columns of GET /api/payouts/export.csv, in order
+PAYOUT_CSV_COLUMNS = [
+    ('id', Payout.id),
+    ('deal_id', Payout.deal_id),
+    ('customer_company', Deal.customer_company),
+    ('company_id', Payout.company_id),
+    ('company_name', Company.name),
+    ('run_id', Payout.run_id),
+    ('revenue_arr', Payout.revenue_arr),
+    ('payout_percentage', Payout.payout_percentage),
+    ('payout_amount', Payout.payout_amount),
+    ('status', Payout.status),
+    ('created_at', Payout.created_at),
+    ('updated_at', Payout.updated_at),
+]
+
+@bp.route('/export.csv', methods=['GET'])
+def export_payouts_csv():
+    """Stream stored payouts as CSV (?gzip=1 for payouts.csv.gz); same filters as GET /api/payouts"""
+    try:
+        query = filter_payouts(Payout.query, request.args) \
+            .outerjoin(Deal, Deal.id == Payout.deal_id) \
+            .outerjoin(Company, Company.id == Payout.company_id) \
+            .order_by(Payout.id)
+        return stream_csv_export(request, query, PAYOUT_CSV_COLUMNS, 'payouts.csv')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/runs', methods=['POST'])
+def create_run():
+    """Run a batch payout calculation for newly won deals"""
+    try:
+        run = create_payout_run()
+        return jsonify({
+            'message': 'Payout run completed successfully',
+            'run': run.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/runs', methods=['GET'])
+def get_runs():
+    """Get payout run history"""
+    try:
+        runs = PayoutRun.query.order_by(PayoutRun.id.desc()).all()
+        return jsonify([run.to_dict() for run in runs]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/calculate', methods=['POST'])
 def calculate_payouts():
-    """Calculate payouts for all won deals"""
+    """
+    Calculate payouts for all won deals.
+
+    Totals are one joined aggregate in SQL. Optional body/query parameters:
+    group_by (company, pam, period; comma-separated or a list), period
+    (month, quarter, year) and incremental (only deals updated since the
+    last calculation's watermark). Also records payouts for newly won deals.
+    """
     try:
-        won_deals = Deal.query.filter_by(status='Won').all()
+        data = request.get_json(silent=True) or {}
+        group_by = data.get('group_by', request.args.get('group_by', ''))
+        if isinstance(group_by, str):
+            group_by = [g.strip() for g in group_by.split(',') if g.strip()]
+        period = data.get('period', request.args.get('period', 'month'))
+        if period not in ('month', 'quarter', 'year'):
+            return jsonify({'error': 'Invalid period. Valid periods: month, quarter, year'}), 400
+        incremental = str(data.get('incremental', request.args.get('incremental', ''))).lower() in ('1', 'true')
         
-        total_payouts = 0
-        for deal in won_deals:
-            company = Company.query.get(deal.company_id)
-            if company:
-                payout_percentage = (company.payout_percentage or 0.0) / 100.0
-                total_payouts += deal.revenue_arr * payout_percentage
+        since = last_watermark() if incremental else None
+        rows = payout_totals(group_by=group_by, period=period, since=since)
         
-        return jsonify({
+        # Record payouts for deals won since the last run
+        run = create_payout_run(since=since)
+        
+        result = {
             'message': 'Payouts calculated successfully',
-            'total_deals': len(won_deals),
-            'total_payouts': total_payouts
-        }), 200
+            'total_deals': sum(row['total_deals'] for row in rows),
+            'total_payouts': sum(row['total_payouts'] for row in rows),
+            'incremental': incremental,
+            'since': since.isoformat() if since else None,
+            'run': run.to_dict()
+        }
+        if group_by:
+            result['groups'] = rows
         
+        return jsonify(result), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/<int:payout_id>/approve', methods=['POST'])
 def approve_payout(payout_id):
     """Approve a payout"""
     try:
-        # In a real system, you'd update a payout record
-        # For now, we'll just return success
-        return jsonify({'message': 'Payout approved successfully'}), 200
+        payout, error = set_payout_status(payout_id, 'Approved')
+        if not payout:
+            return jsonify({'error': error}), 404
+        if error:
+            return jsonify({'error': error}), 400
+        
+        return jsonify({
+            'message': 'Payout approved successfully',
+            'payout': payout.to_dict()
+        }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/<int:payout_id>/reject', methods=['POST'])
 def reject_payout(payout_id):
     """Reject a payout"""
     try:
-        # In a real system, you'd update a payout record
-        # For now, we'll just return success
-        return jsonify({'message': 'Payout rejected successfully'}), 200
+        payout, error = set_payout_status(payout_id, 'Rejected')
+        if not payout:
+            return jsonify({'error': error}), 404
+        if error:
+            return jsonify({'error': error}), 400
+        
+        return jsonify({
+            'message': 'Payout rejected successfully',
+            'payout': payout.to_dict()
+        }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/summary', methods=['GET'])
 def get_payouts_summary():
     """Get payout summary grouped by company"""
     try:
-        # Get all companies
-        companies = Company.query.all()
+        # Open deal count and value per company come from the company_deal_stats rollup
+        # (20% payout based on open deals)
+        pam = aliased(User)
+        rows = db.session.query(
+            Company.id,
+            Company.name,
+            Company.payout_percentage,
+            pam.username,
+            CompanyDealStats.open_deals,
+            CompanyDealStats.open_pipeline_value
+        ).join(CompanyDealStats, CompanyDealStats.company_id == Company.id) \
+         .outerjoin(pam, pam.id == Company.pam_id) \
+         .filter(CompanyDealStats.open_deals > 0) \
+         .order_by(Company.id).all()
         
         summary = []
-        for company in companies:
-            # Get open deals for this company (20% payout based on open deals)
-            open_deals = Deal.query.filter_by(
-                company_id=company.id,
-                status='Open'
-            ).all()
-            
-            if not open_deals:
-                continue
-            
-            # Calculate totals
-            deals_count = len(open_deals)
-            total_deals_value = sum(deal.revenue_arr or 0 for deal in open_deals)
+        for company_id, company_name, company_payout_percentage, pam_username, deals_count, total_deals_value in rows:
             # Use company-specific payout percentage
-            payout_percentage = (company.payout_percentage or 0.0) / 100.0
+            payout_percentage = (company_payout_percentage or 0.0) / 100.0
             payout_amount = total_deals_value * payout_percentage
             
-            # Get PAM info
-            pam = User.query.get(company.pam_id) if company.pam_id else None
-            pam_name = pam.username if pam else 'Unassigned'
-            
             summary.append({
-                'company_id': company.id,
-                'company_name': company.name,
-                'pam_name': pam_name,
+                'company_id': company_id,
+                'company_name': company_name,
+                'pam_name': pam_username or 'Unassigned',
                 'deals_count': deals_count,
                 'total_deals_value': total_deals_value,
                 'payout_amount': payout_amount,
@@ -130,4 +235,3 @@ def get_payouts_summary():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
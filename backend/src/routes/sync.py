@@ -0,0 +1,17 @@
+"""
+Delta sync routes
+"""
+from flask import Blueprint, request, jsonify
+from src.utils.sync import changes_since, parse_since, parse_sync_limit
+
+bp = Blueprint('sync', __name__)
+
+@bp.route('', methods=['GET'])
+def get_changes():
+    """Rows created, updated or deleted after ?since= (omit it for a full snapshot)"""
+    try:
+        return jsonify(changes_since(parse_since(request.args), parse_sync_limit(request.args))), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
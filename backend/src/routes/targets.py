@@ -2,7 +2,11 @@
 Targets management routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, Target
+from src.models.database import db, User, Company, Target, serialize_targets
+from src.utils.streaming import stream_format, stream_query
+from src.utils.pagination import parse_date
+from src.utils.target_progress import evaluate_targets
+from src.utils.etag import conditional_response, model_source
 
 bp = Blueprint('targets', __name__)
 
@@ -10,8 +14,38 @@ bp = Blueprint('targets', __name__)
 def get_targets():
     """Get all targets"""
     try:
-        targets = Target.query.all()
-        return jsonify([target.to_dict() for target in targets]), 200
+        fmt = stream_format(request)
+        if fmt:
+            return stream_query(Target.query, Target.id, serialize_targets, fmt)
+        
+        # Rows embed the target user's or company's name
+        sources = [model_source(Target), model_source(User), model_source(Company)]
+        return conditional_response(sources, lambda: jsonify(serialize_targets(Target.query.all())))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/progress', methods=['GET'])
+def get_targets_progress():
+    """
+    Get attainment for every target in its current period.
+
+    Optional filters: target_type, target_period, target_entity_id;
+    as_of (ISO date) evaluates the periods containing that date instead of now.
+    """
+    try:
+        args = request.args
+        query = Target.query
+        for field in ('target_type', 'target_period'):
+            if args.get(field):
+                query = query.filter(getattr(Target, field) == args[field])
+        if args.get('target_entity_id'):
+            query = query.filter(Target.target_entity_id == int(args['target_entity_id']))
+        
+        as_of = parse_date(args['as_of']) if args.get('as_of') else None
+        return jsonify(evaluate_targets(query.all(), as_of=as_of)), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
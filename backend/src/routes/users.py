@@ -2,7 +2,11 @@
 Users management routes
 """
 from flask import Blueprint, request, jsonify
-from src.models.database import db, User
+from src.models.database import db, User, Company, serialize_users
+from src.utils.permissions import revoke_user_tokens
+from src.utils.passwords import PasswordHasherBusy
+from src.utils.streaming import stream_format, stream_query
+from src.utils.etag import conditional_response, model_source, assignments_source
 
 bp = Blueprint('users', __name__)
 
@@ -10,8 +14,13 @@ bp = Blueprint('users', __name__)
 def get_users():
     """Get all users"""
     try:
-        users = User.query.all()
-        return jsonify([user.to_dict() for user in users]), 200
+        fmt = stream_format(request)
+        if fmt:
+            return stream_query(User.query, User.id, serialize_users, fmt)
+        
+        # Rows embed their company name and PAM assignments
+        sources = [model_source(User), model_source(Company), assignments_source()]
+        return conditional_response(sources, lambda: jsonify(serialize_users(User.query.all())))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -48,6 +57,9 @@ def create_user():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -71,20 +83,32 @@ def update_user(user_id):
                 if existing_user:
                     return jsonify({'error': 'Email already in use'}), 400
             user.email = data['email']
-        if 'role' in data:
+        # Role, company and password changes revoke tokens issued before them
+        revoke = False
+        if 'role' in data and data['role'] != user.role:
             user.role = data['role']
-        if 'company_id' in data:
+            revoke = True
+        if 'company_id' in data and data['company_id'] != user.company_id:
             user.company_id = data['company_id']
+            revoke = True
         if 'password' in data:
             user.set_password(data['password'])
+            revoke = True
+        if revoke:
+            user.token_version = (user.token_version or 0) + 1
         
         db.session.commit()
+        if revoke:
+            revoke_user_tokens(user.id, user.token_version)
         
         return jsonify({
             'message': 'User updated successfully',
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -99,6 +123,7 @@ def delete_user(user_id):
         
         db.session.delete(user)
         db.session.commit()
+        revoke_user_tokens(user_id, None)
         
         return jsonify({'message': 'User deleted successfully'}), 200
         
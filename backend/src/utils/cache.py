@@ -0,0 +1,109 @@
+"""
+In-process result cache for read-heavy endpoints
+
+Entries are keyed by endpoint and query parameters and expire after a TTL.
+Each entry records the data version it was computed at, and entries from an
+older version are treated as misses. The version lives in the database (see
+data_version()), so a committed write invalidates the cache of every worker
+process, whichever one handled the write.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response, g, has_request_context
+from sqlalchemy import func
+from src.models.database import db, SyncChange
+
+DEFAULT_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', '60'))
+MAX_ENTRIES = int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '256'))
+
+def _read_data_version():
+    return db.session.query(func.max(SyncChange.seq)).scalar() or 0
+
+def data_version():
+    """
+    Current data version: the newest sequence number in sync_changes. Triggers
+    advance it in the writing transaction on every insert, update and delete
+    of the synced tables (deals, deal notes, companies, users, targets), which
+    are what the cached results are computed from. Read once per request.
+    """
+    if not has_request_context():
+        return _read_data_version()
+    if 'data_version' not in g:
+        g.data_version = _read_data_version()
+    return g.data_version
+
+class ResultCache:
+    """Bounded LRU of (data version, expiry, value) entries with hit/miss counters"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, version, ttl, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        version = data_version()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'data_version': version
+            }
+
+result_cache = ResultCache()
+
+def cached_response(ttl=None):
+    """Decorator caching a view's successful response body by endpoint and query string"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            # Read the version before computing so a concurrent write is never masked
+            version = data_version()
+
+            cached = result_cache.get(key, version)
+            if cached is not None:
+                body, mimetype = cached
+                response = Response(body, status=200, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                result_cache.set(key, version, ttl or DEFAULT_TTL, (response.get_data(), response.mimetype))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return decorated_function
+    return decorator
@@ -0,0 +1,105 @@
+"""
+Company facets: filtering and counts by tag, region and company attributes
+
+Tags and serving regions stay comma-separated strings on the company (that
+is what the API returns), and company_tags / company_regions index each
+value, so "companies tagged X" is an index lookup rather than a LIKE over
+every row. Every path that writes those columns calls index_company_facets()
+in the same transaction.
+"""
+from sqlalchemy import func, literal, select, union_all, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.database import db, Company, company_tags, company_regions, split_list
+
+# Multi-valued facets: query parameter -> (index table, value column); values
+# compare case-insensitively (NOCASE columns)
+LIST_FACETS = {
+    'tag': (company_tags, company_tags.c.tag),
+    'region': (company_regions, company_regions.c.region),
+}
+
+# Single-valued facets: query parameter -> company column
+COLUMN_FACETS = {
+    'country': Company.country,
+    'partner_stage': Company.partner_stage,
+    'company_type': Company.company_type,
+    'published': func.coalesce(Company.published, False),
+}
+
+def index_company_facets(rows, conn=None):
+    """
+    Rewrite the tag/region index rows of companies.
+
+    rows: (company_id, tags, serving_regions) tuples, in LIST_FACETS order.
+    conn defaults to the session, so the caller's commit covers the index too.
+    """
+    conn = conn or db.session
+    rows = list(rows)
+    if not rows:
+        return
+    company_ids = [company_id for company_id, _, _ in rows]
+    for position, (table, value_column) in enumerate(LIST_FACETS.values(), start=1):
+        conn.execute(table.delete().where(table.c.company_id.in_(company_ids)))
+        values = [{'company_id': row[0], value_column.key: value}
+                  for row in rows for value in split_list(row[position])]
+        if values:
+            # NOCASE primary key: values differing only in case are stored once
+            conn.execute(sqlite_insert(table).on_conflict_do_nothing(), values)
+
+def remove_company_facets(company_id):
+    for table, _ in LIST_FACETS.values():
+        db.session.execute(table.delete().where(table.c.company_id == company_id))
+
+def _values(args, param):
+    return [value.strip() for value in args.get(param, '').split(',') if value.strip()]
+
+def filter_companies(query, args):
+    """
+    Apply ?tag=, ?region=, ?country=, ?partner_stage=, ?company_type= and ?published=.
+
+    Each takes one value or a comma-separated list (any of them matches);
+    different parameters must all match.
+    """
+    for param, (table, value_column) in LIST_FACETS.items():
+        values = _values(args, param)
+        if values:
+            query = query.filter(Company.id.in_(select(table.c.company_id).where(value_column.in_(values))))
+    for param, column in COLUMN_FACETS.items():
+        values = _values(args, param)
+        if not values:
+            continue
+        if param == 'published':
+            if any(value.lower() not in ('1', 'true', '0', 'false') for value in values):
+                raise ValueError('published must be true or false')
+            values = [value.lower() in ('1', 'true') for value in values]
+        query = query.filter(column.in_(values))
+    return query
+
+def facet_counts(query):
+    """
+    {facet: [{'value', 'count'}, ...]} over the companies matched by query,
+    most common first, computed with one statement.
+    """
+    matched = query.with_entities(Company.id.label('id')).order_by(None).subquery('matched')
+    parts = []
+    for param, (table, value_column) in LIST_FACETS.items():
+        parts.append(select(literal(param, String).label('facet'), value_column.label('value'),
+                            func.count().label('count'))
+                     .join(matched, matched.c.id == table.c.company_id)
+                     .group_by(value_column))
+    for param, column in COLUMN_FACETS.items():
+        parts.append(select(literal(param, String).label('facet'), column.label('value'),
+                            func.count().label('count'))
+                     .join(matched, matched.c.id == Company.id)
+                     .group_by(column))
+
+    facets = {param: [] for param in (*LIST_FACETS, *COLUMN_FACETS)}
+    for facet, value, count in db.session.execute(union_all(*parts)):
+        if value is None:
+            continue
+        if facet == 'published':
+            value = bool(value)
+        facets[facet].append({'value': value, 'count': count})
+    for values in facets.values():
+        values.sort(key=lambda item: (-item['count'], str(item['value']).lower()))
+    return facets
@@ -0,0 +1,145 @@
+"""
+Company payload handling and bulk onboarding
+
+company_values() maps a create payload to Company columns for both the
+single and the bulk endpoint. onboard_companies() dedupes a whole batch in
+one pass: the unique-ish fields of every existing company are loaded with a
+single query into sets of normalized keys (and the PAM ids with another), each row is checked against those
+sets and against the rows before it, and the accepted companies plus their
+PAM assignment and tag/region index rows are inserted in bulk in one transaction.
+"""
+import re
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.database import db, Company, User, pam_company_assignments
+from src.utils.company_facets import index_company_facets
+
+REQUIRED_FIELDS = ('name', 'company_type', 'contact_email', 'spoc_name', 'spoc_email',
+                   'country', 'serving_regions', 'partner_stage')
+
+# Checked in this order, with the same messages as POST /api/companies
+DUPLICATE_CHECKS = (
+    ('name', 'Company with this name already exists'),
+    ('spoc_email', 'A company with this SPOC email already exists'),
+    ('contact_email', 'A company with this email already exists'),
+    ('website', 'A company with this website already exists'),
+)
+
+PAM_ROLE = 'Partner Account Manager'
+
+def normalize_key(field, value):
+    """Comparison key for duplicate detection (case/whitespace/URL-prefix insensitive)"""
+    if value is None:
+        return None
+    key = re.sub(r'\s+', ' ', str(value)).strip().lower()
+    if field == 'website':
+        key = re.sub(r'^https?://', '', key)
+        key = re.sub(r'^www\.', '', key).rstrip('/')
+    return key or None
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def company_values(data):
+    """Company column values from a create payload (accepts the frontend's alias field names)"""
+    tags = data.get('tags', '')
+    if isinstance(tags, list):
+        tags = ','.join(tags)
+    pam_id = data.get('pam_id') or data.get('assigned_pam_id')
+    return {
+        'name': data['name'],
+        'company_type': data.get('company_type', 'Partner'),
+        'website': data.get('website'),
+        'contact_email': data.get('contact_email') or data.get('email'),
+        'contact_phone': data.get('contact_phone') or data.get('phone_number'),
+        'logo_url': data.get('logo_url'),
+        'spoc_name': data.get('spoc_name'),
+        'spoc_email': data.get('spoc_email'),
+        'spoc_phone': data.get('spoc_phone'),
+        'country': data.get('country'),
+        'serving_regions': data.get('serving_regions'),
+        'partner_stage': data.get('partner_stage', 'Registered'),
+        'published': _flag(data.get('published') or data.get('published_on_website', False)),
+        'tags': tags or '',
+        'pam_id': int(pam_id) if pam_id else None,
+        'payout_percentage': float(data.get('payout_percentage') or 0.0),
+    }
+
+def load_existing_keys():
+    """Normalized keys of every existing company, per duplicate-checked field, in one query"""
+    fields = [field for field, _ in DUPLICATE_CHECKS]
+    existing = {field: set() for field in fields}
+    for row in db.session.query(*(getattr(Company, field) for field in fields)):
+        for field, value in zip(fields, row):
+            key = normalize_key(field, value)
+            if key:
+                existing[field].add(key)
+    return existing
+
+def add_pam_assignments(pairs):
+    """Insert (pam_id, company_id) assignment rows, skipping ones that already exist"""
+    rows = [{'pam_id': pam_id, 'company_id': company_id} for pam_id, company_id in pairs]
+    if rows:
+        db.session.execute(sqlite_insert(pam_company_assignments).on_conflict_do_nothing(), rows)
+
+def onboard_companies(numbered_rows):
+    """
+    Validate, dedupe and insert a batch of companies in one transaction.
+
+    Returns {'created', 'failed', 'companies': [{'id', 'name'}], 'errors': [{'row', 'error'}]}.
+    The caller commits.
+    """
+    existing = load_existing_keys()
+    pam_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.role == PAM_ROLE)}
+    accepted, errors = [], []
+
+    for number, row in numbered_rows:
+        if isinstance(row, Exception) or not isinstance(row, dict):
+            errors.append({'row': number, 'error': str(row) if isinstance(row, Exception) else 'Each row must be an object'})
+            continue
+        missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+        if missing:
+            errors.append({'row': number, 'error': f'Required fields missing: {", ".join(missing)}'})
+            continue
+        try:
+            values = company_values(row)
+        except (TypeError, ValueError):
+            errors.append({'row': number, 'error': 'pam_id and payout_percentage must be numbers'})
+            continue
+        if values['pam_id'] and values['pam_id'] not in pam_ids:
+            errors.append({'row': number, 'error': f"User {values['pam_id']} is not a Partner Account Manager"})
+            continue
+
+        keys = {field: normalize_key(field, values[field]) for field, _ in DUPLICATE_CHECKS}
+        duplicate = next((message for field, message in DUPLICATE_CHECKS
+                          if keys[field] and keys[field] in existing[field]), None)
+        if duplicate:
+            errors.append({'row': number, 'error': duplicate})
+            continue
+        # Later rows in the same batch are checked against this one too
+        for field, key in keys.items():
+            if key:
+                existing[field].add(key)
+        accepted.append((number, values))
+
+    created = []
+    if accepted:
+        # Core insert on the table: the ORM bulk path would split the batch
+        # into per-row statements wherever nullable columns mix None and values
+        companies = Company.__table__
+        result = db.session.execute(
+            insert(companies).returning(companies.c.id, companies.c.name, companies.c.pam_id,
+                                        companies.c.tags, companies.c.serving_regions),
+            [values for _, values in accepted])
+        created = result.all()
+        add_pam_assignments((pam_id, company_id) for company_id, _, pam_id, _, _ in created if pam_id)
+        index_company_facets((company_id, tags, regions) for company_id, _, _, tags, regions in created)
+
+    return {
+        'created': len(created),
+        'failed': len(errors),
+        'companies': [{'id': company_id, 'name': name} for company_id, name, _, _, _ in created],
+        'errors': errors,
+    }
@@ -0,0 +1,37 @@
+"""
+gzip compression of JSON and text responses
+
+Buffered responses of at least GZIP_MIN_SIZE bytes are compressed when the
+client accepts gzip. Streamed responses are left alone (the CSV exports
+compress themselves), as are bodies below one packet, where the header
+overhead outweighs the saving.
+"""
+import gzip
+import os
+from flask import request
+
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '1400'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html')
+
+def compress_response(response):
+    """after_request hook: gzip the body if the client and the response allow it"""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or not request.accept_encodings['gzip']):
+        return response
+
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def register_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,323 @@
+"""
+Deal funnel and velocity analytics from daily snapshots
+
+deal_status_events records every status transition. Once a day is over its
+events never change (triggers stamp events with the current time), so each
+finished day is reduced once to snapshot rows per company:
+
+  deal_funnel_daily    deals first reaching each stage that day
+  deal_duration_daily  histograms of time spent in a stage (counted on the
+                       day the deal left it) and of creation-to-win time
+
+Reports sum those rows over a date range and group them by partner or PAM.
+Days after the last snapshot (today, and any the daily job has not reached)
+are computed live from their own events. Reports only read: snapshots are
+written by `flask deal-funnel refresh`, run from cron.
+Medians are read off the merged histograms (interpolated within a bucket),
+so they are approximate; counts and means are exact.
+"""
+from bisect import bisect_right
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import func, literal
+from src.models.database import (db, Company, User, DealStatusEvent, DealFunnelDaily,
+                                 DealDurationDaily, DealFunnelDay, load_names)
+from src.utils.pagination import parse_date
+
+# Stages in funnel order; reaching a stage implies passing the earlier ones
+FUNNEL_STAGES = ('Open', 'In Progress', 'Won')
+LOST_STAGE = 'Lost'
+STAGE_RANK = {stage: rank for rank, stage in enumerate(FUNNEL_STAGES)}
+
+# Stages whose duration is tracked, plus creation-to-win
+TIMED_STAGES = ('Open', 'In Progress')
+WIN_CYCLE = 'win_cycle'
+
+# Upper bounds (hours) of the histogram buckets; the last bucket is open-ended
+DURATION_BUCKETS_HOURS = (1, 4, 12, 24, 48, 72, 120, 168, 240, 336, 504, 720,
+                          1080, 1440, 2160, 2880, 4320, 6480, 8760)
+
+FUNNEL_GROUPINGS = ('company', 'pam', 'overall')
+
+# Deal ids per history lookup, well under SQLite's bound-parameter limit
+HISTORY_CHUNK_SIZE = 500
+
+class _DealState:
+    __slots__ = ('max_rank', 'lost', 'created_at', 'entered_at')
+
+    def __init__(self):
+        self.max_rank = -1
+        self.lost = False
+        self.created_at = None
+        self.entered_at = None  # When the deal entered its current status
+
+class DaySnapshot:
+    """Snapshot rows for one day, keyed by company"""
+
+    def __init__(self):
+        self.funnel = {}     # (company_id, stage) -> entered
+        self.durations = {}  # (company_id, metric, bucket) -> [count, total_hours]
+
+    def enter(self, company_id, stage):
+        key = (company_id, stage)
+        self.funnel[key] = self.funnel.get(key, 0) + 1
+
+    def duration(self, company_id, metric, start, end):
+        hours = max((end - start).total_seconds() / 3600.0, 0.0)
+        entry = self.durations.setdefault((company_id, metric, bisect_right(DURATION_BUCKETS_HOURS, hours)), [0, 0.0])
+        entry[0] += 1
+        entry[1] += hours
+
+def _apply(event, state, snapshot=None):
+    """Advance a deal's state by one event, recording metrics into snapshot if given"""
+    if event.from_status is None:
+        state.created_at = event.changed_at
+    elif snapshot and event.from_status in TIMED_STAGES and state.entered_at:
+        snapshot.duration(event.company_id, event.from_status, state.entered_at, event.changed_at)
+
+    rank = STAGE_RANK.get(event.to_status)
+    if rank is not None and rank > state.max_rank:
+        if snapshot:
+            for stage in FUNNEL_STAGES[state.max_rank + 1:rank + 1]:
+                snapshot.enter(event.company_id, stage)
+            if event.to_status == 'Won' and state.created_at:
+                snapshot.duration(event.company_id, WIN_CYCLE, state.created_at, event.changed_at)
+        state.max_rank = rank
+    elif event.to_status == LOST_STAGE and not state.lost:
+        if snapshot:
+            snapshot.enter(event.company_id, LOST_STAGE)
+        state.lost = True
+    state.entered_at = event.changed_at
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+def status_events_query(start=None, end=None):
+    """Status events in [start, end) (None: unbounded) in the order they happened"""
+    events = DealStatusEvent.query
+    if start is not None:
+        events = events.filter(DealStatusEvent.changed_at >= start)
+    if end is not None:
+        events = events.filter(DealStatusEvent.changed_at < end)
+    return events.order_by(DealStatusEvent.changed_at, DealStatusEvent.id)
+
+def status_history_query(deal_ids, before):
+    """Earlier events of the given deals, per deal in the order they happened"""
+    return DealStatusEvent.query \
+        .filter(DealStatusEvent.deal_id.in_(deal_ids), DealStatusEvent.changed_at < before) \
+        .order_by(DealStatusEvent.deal_id, DealStatusEvent.changed_at, DealStatusEvent.id)
+
+def compute_range(start=None, end=None):
+    """
+    DaySnapshot of the events in [start, end) (None: unbounded), replaying
+    each deal's earlier events for context
+    """
+    events = status_events_query(start, end).all()
+    snapshot = DaySnapshot()
+    if not events:
+        return snapshot
+
+    states = {}
+    deal_ids = sorted({event.deal_id for event in events}) if start is not None else []
+    for offset in range(0, len(deal_ids), HISTORY_CHUNK_SIZE):
+        for event in status_history_query(deal_ids[offset:offset + HISTORY_CHUNK_SIZE], start):
+            _apply(event, states.setdefault(event.deal_id, _DealState()))
+
+    for event in events:
+        _apply(event, states.setdefault(event.deal_id, _DealState()), snapshot)
+    return snapshot
+
+def compute_day(day):
+    """DaySnapshot of the events on day"""
+    return compute_range(*_day_bounds(day))
+
+def write_day(day, snapshot):
+    """Replace the stored snapshot rows of day (the caller commits)"""
+    db.session.query(DealFunnelDaily).filter(DealFunnelDaily.day == day).delete()
+    db.session.query(DealDurationDaily).filter(DealDurationDaily.day == day).delete()
+    if snapshot.funnel:
+        db.session.execute(DealFunnelDaily.__table__.insert(), [
+            {'day': day, 'company_id': company_id, 'stage': stage, 'entered': entered}
+            for (company_id, stage), entered in snapshot.funnel.items()])
+    if snapshot.durations:
+        db.session.execute(DealDurationDaily.__table__.insert(), [
+            {'day': day, 'company_id': company_id, 'metric': metric, 'bucket': bucket,
+             'count': count, 'total_hours': total_hours}
+            for (company_id, metric, bucket), (count, total_hours) in snapshot.durations.items()])
+    db.session.merge(DealFunnelDay(day=day, computed_at=datetime.utcnow()))
+
+def snapshots_through():
+    """Last day with stored snapshots, or None"""
+    return db.session.query(func.max(DealFunnelDay.day)).scalar()
+
+def refresh_funnel_snapshots(through=None, rebuild=False):
+    """
+    Snapshot every finished day up to through (default yesterday, UTC) not
+    stored yet; rebuild=True recomputes all of them. Each day is committed on
+    its own. Returns the number of days with events that were computed.
+    """
+    through = through or datetime.utcnow().date() - timedelta(days=1)
+    if rebuild:
+        for model in (DealFunnelDaily, DealDurationDaily, DealFunnelDay):
+            db.session.query(model).delete()
+        db.session.commit()
+
+    last = snapshots_through()
+    if last is not None and last >= through:
+        return 0
+    start = datetime.combine(last + timedelta(days=1), time.min) if last else None
+    _, end = _day_bounds(through)
+
+    days_with_events = db.session.query(func.date(DealStatusEvent.changed_at)).distinct() \
+        .filter(DealStatusEvent.changed_at < end)
+    if start:
+        days_with_events = days_with_events.filter(DealStatusEvent.changed_at >= start)
+    days = sorted(date.fromisoformat(value) for (value,) in days_with_events)
+
+    for day in days:
+        write_day(day, compute_day(day))
+        db.session.commit()
+    # Mark the range as done even when its last days had no events
+    db.session.merge(DealFunnelDay(day=through, computed_at=datetime.utcnow()))
+    db.session.commit()
+    return len(days)
+
+def histogram_summary(buckets):
+    """{'count', 'median_hours', 'mean_hours'} from {bucket: [count, total_hours]}"""
+    count = sum(entry[0] for entry in buckets.values())
+    if not count:
+        return {'count': 0, 'median_hours': None, 'mean_hours': None}
+    total_hours = sum(entry[1] for entry in buckets.values())
+
+    half, seen, median = count / 2.0, 0, None
+    for bucket in sorted(buckets):
+        in_bucket = buckets[bucket][0]
+        if in_bucket and seen + in_bucket >= half:
+            low = DURATION_BUCKETS_HOURS[bucket - 1] if bucket > 0 else 0.0
+            if bucket < len(DURATION_BUCKETS_HOURS):
+                high = DURATION_BUCKETS_HOURS[bucket]
+                median = low + (high - low) * (half - seen) / in_bucket
+            else:
+                # Open-ended last bucket: its mean is the best estimate available
+                median = buckets[bucket][1] / in_bucket
+            break
+        seen += in_bucket
+    return {'count': count, 'median_hours': round(median, 2), 'mean_hours': round(total_hours / count, 2)}
+
+def parse_funnel_range(args):
+    """(first day, last day) from ?date_from= / ?date_to=, either may be None"""
+    date_from = parse_date(args['date_from']).date() if args.get('date_from') else None
+    date_to = parse_date(args['date_to']).date() if args.get('date_to') else None
+    return date_from, date_to
+
+def funnel_report(args):
+    """
+    Funnel and velocity per group (?group_by=company|pam|overall, default company).
+
+    Optional filters: date_from/date_to (days, inclusive) and company_id.
+    """
+    group_by = args.get('group_by', 'company')
+    if group_by not in FUNNEL_GROUPINGS:
+        raise ValueError(f'Invalid group_by. Valid values: {", ".join(FUNNEL_GROUPINGS)}')
+    company_id = int(args['company_id']) if args.get('company_id') else None
+    date_from, date_to = parse_funnel_range(args)
+    through = snapshots_through()
+
+    def grouped(model, keys, sums):
+        if group_by == 'company':
+            # Deals of since-deleted companies still count under their company id
+            group = model.company_id
+        elif group_by == 'pam':
+            group = Company.pam_id
+        else:
+            group = literal(None)
+        query = db.session.query(group, *keys, *(func.sum(column) for column in sums))
+        if group_by == 'pam':
+            query = query.outerjoin(Company, Company.id == model.company_id)
+        if company_id is not None:
+            query = query.filter(model.company_id == company_id)
+        if date_from:
+            query = query.filter(model.day >= date_from)
+        if date_to:
+            query = query.filter(model.day <= date_to)
+        return query.group_by(group, *keys)
+
+    funnel, durations = {}, {}
+    for key, stage, entered in grouped(DealFunnelDaily, [DealFunnelDaily.stage], [DealFunnelDaily.entered]):
+        funnel.setdefault(key, {})[stage] = entered
+    for key, metric, bucket, count, total_hours in grouped(
+            DealDurationDaily, [DealDurationDaily.metric, DealDurationDaily.bucket],
+            [DealDurationDaily.count, DealDurationDaily.total_hours]):
+        durations.setdefault(key, {}).setdefault(metric, {})[bucket] = [count, total_hours]
+
+    # Days after the last snapshot are added live from their events
+    live_from = through + timedelta(days=1) if through else None
+    if date_from and (live_from is None or date_from > live_from):
+        live_from = date_from
+    if date_to is None or live_from is None or live_from <= date_to:
+        start = datetime.combine(live_from, time.min) if live_from else None
+        end = _day_bounds(date_to)[1] if date_to else None
+        _merge_live(compute_range(start, end), funnel, durations, group_by, company_id)
+
+    return _report_rows(funnel, durations, group_by)
+
+def _merge_live(snapshot, funnel, durations, group_by, company_id):
+    company_ids = {key[0] for key in snapshot.funnel} | {key[0] for key in snapshot.durations}
+    pam_ids = dict(db.session.query(Company.id, Company.pam_id).filter(Company.id.in_(company_ids))) \
+        if group_by == 'pam' and company_ids else {}
+
+    def group_key(key_company_id):
+        if group_by == 'company':
+            return key_company_id
+        if group_by == 'pam':
+            return pam_ids.get(key_company_id)
+        return None
+
+    for (key_company_id, stage), entered in snapshot.funnel.items():
+        if company_id is None or key_company_id == company_id:
+            stages = funnel.setdefault(group_key(key_company_id), {})
+            stages[stage] = stages.get(stage, 0) + entered
+    for (key_company_id, metric, bucket), (count, total_hours) in snapshot.durations.items():
+        if company_id is None or key_company_id == company_id:
+            entry = durations.setdefault(group_key(key_company_id), {}).setdefault(metric, {}) \
+                .setdefault(bucket, [0, 0.0])
+            entry[0] += count
+            entry[1] += total_hours
+
+def _report_rows(funnel, durations, group_by):
+    keys = sorted(set(funnel) | set(durations), key=lambda key: (key is None, key or 0))
+    if group_by == 'company':
+        names = load_names(Company, (key for key in keys if key is not None), 'name')
+    elif group_by == 'pam':
+        names = load_names(User, (key for key in keys if key is not None), 'username')
+    else:
+        names = {}
+
+    report = []
+    for key in keys:
+        entered = funnel.get(key, {})
+        stages = []
+        for index, stage in enumerate(FUNNEL_STAGES):
+            count = entered.get(stage, 0)
+            following = entered.get(FUNNEL_STAGES[index + 1], 0) if index + 1 < len(FUNNEL_STAGES) else None
+            stages.append({
+                'stage': stage,
+                'entered': count,
+                # Share of the deals entering this stage that reached the next one
+                'conversion_rate': round(following / count, 4) if following is not None and count else None
+            })
+        opened, won = entered.get(FUNNEL_STAGES[0], 0), entered.get('Won', 0)
+        timings = durations.get(key, {})
+        row = {
+            'stages': stages,
+            'lost': entered.get(LOST_STAGE, 0),
+            'win_rate': round(won / opened, 4) if opened else None,
+            'time_in_stage': {stage: histogram_summary(timings.get(stage, {})) for stage in TIMED_STAGES},
+            'win_cycle': histogram_summary(timings.get(WIN_CYCLE, {})),
+        }
+        if group_by == 'company':
+            row = {'company_id': key, 'company_name': names.get(key), **row}
+        elif group_by == 'pam':
+            row = {'pam_id': key, 'pam_name': names.get(key), **row}
+        report.append(row)
+    return report
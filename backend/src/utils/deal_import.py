@@ -0,0 +1,141 @@
+"""
+Bulk deal import (CSV / NDJSON)
+
+Rows are read from the upload as a stream and handled in chunks of
+BULK_IMPORT_CHUNK_SIZE: each chunk is validated in Python against a
+company-id set loaded once up front, then written with a single executemany
+INSERT plus one rollup upsert per company, and committed. A failing row is
+reported with its row number and never blocks the rest of the file.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import insert
+from src.models.database import db, Deal
+from src.utils.deal_stats import snapshot_deal, record_deals_created
+
+CHUNK_SIZE = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', '1000'))
+MAX_REPORTED_ERRORS = int(os.getenv('BULK_IMPORT_MAX_ERRORS', '1000'))
+
+DEAL_STATUSES = ('Open', 'In Progress', 'Won', 'Lost')
+REQUIRED_FIELDS = ('company_id', 'customer_company', 'customer_spoc', 'customer_spoc_email', 'revenue_arr')
+
+def import_format(request):
+    """'csv' or 'ndjson' from ?format=, the upload's file name or the Content-Type"""
+    fmt = request.args.get('format')
+    if not fmt:
+        upload = request.files.get('file')
+        name = (upload.filename or '') if upload else ''
+        content_type = (upload.mimetype if upload else request.mimetype) or ''
+        if name.endswith('.csv') or content_type == 'text/csv':
+            fmt = 'csv'
+        elif name.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+            fmt = 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('Unsupported upload: send text/csv or application/x-ndjson (or ?format=csv|ndjson)')
+    return fmt
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, row) from a binary stream without reading it all into memory"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        # Row 1 is the header, so data rows are numbered as a spreadsheet shows them
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def validate_row(row, company_ids):
+    """Return (values, None) for a valid row or (None, error message)"""
+    if isinstance(row, Exception):
+        return None, str(row)
+
+    missing = [field for field in REQUIRED_FIELDS if _blank(row.get(field))]
+    if missing:
+        return None, f'{", ".join(missing)} required'
+
+    try:
+        company_id = int(row['company_id'])
+    except (TypeError, ValueError):
+        return None, 'company_id must be an integer'
+    if company_id not in company_ids:
+        return None, f'Company {company_id} does not exist or is not accessible'
+
+    try:
+        revenue_arr = float(row['revenue_arr'])
+    except (TypeError, ValueError):
+        return None, 'revenue_arr must be a number'
+
+    status = row.get('status')
+    status = 'Open' if _blank(status) else str(status).strip()
+    if status not in DEAL_STATUSES:
+        return None, f'Invalid status. Valid values: {", ".join(DEAL_STATUSES)}'
+
+    values = {field: str(row[field]).strip() for field in ('customer_company', 'customer_spoc', 'customer_spoc_email')}
+    for field in ('customer_company_url', 'customer_spoc_phone', 'comments'):
+        values[field] = None if _blank(row.get(field)) else str(row[field])
+    values.update(company_id=company_id, revenue_arr=revenue_arr, status=status)
+    return values, None
+
+def _write_chunk(rows):
+    """Insert one chunk of validated rows and its rollup delta in one transaction"""
+    # Stamped here rather than by column defaults so the rollup sees the same days
+    now = datetime.utcnow()
+    for row in rows:
+        row.update(created_at=now, won_at=now if row['status'] == 'Won' else None)
+    # Core insert on the table keeps this one executemany even when optional
+    # columns mix None and values (the ORM bulk path splits such batches)
+    db.session.execute(insert(Deal.__table__), rows)
+    record_deals_created(snapshot_deal(SimpleNamespace(revenue_actual=None, **row)) for row in rows)
+    db.session.commit()
+
+def import_deals(numbered_rows, company_ids, chunk_size=CHUNK_SIZE):
+    """
+    Validate and insert rows chunk by chunk.
+
+    Returns {'inserted', 'failed', 'errors': [{'row', 'error'}]}; errors
+    beyond MAX_REPORTED_ERRORS are counted but not listed.
+    """
+    result = {'inserted': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, message):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': number, 'error': message})
+
+    def flush(chunk):
+        try:
+            _write_chunk([values for _, values in chunk])
+            result['inserted'] += len(chunk)
+        except Exception as e:
+            db.session.rollback()
+            for number, _ in chunk:
+                fail(number, f'Not imported, chunk failed: {e}')
+
+    chunk = []
+    for number, row in numbered_rows:
+        values, error = validate_row(row, company_ids)
+        if error:
+            fail(number, error)
+            continue
+        chunk.append((number, values))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return result
@@ -0,0 +1,74 @@
+"""
+Full-text deal search over the FTS5 indexes in src/models/search_index.py
+
+A deal matches if its own fields or any of its notes match. Scores are
+FTS5 bm25 (lower is better, with customer name and SPOC weighted above
+free-text comments); a deal matched several ways keeps its best score.
+When a term is broad (more than SEARCH_CANDIDATES matches in an index),
+that index's matches are not scored by bm25 but ranked by recency, newest
+deal first. Only the ranking is cheapened: every match is still returned,
+so scoping, filters and paging see all of them.
+"""
+import os
+import re
+from sqlalchemy import text, Integer, Float
+from src.models.database import db
+
+# When a term matches more rows than this in an index, that index's matches
+# are ranked by recency (deal id) instead of by bm25
+SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES', '1000'))
+
+# bm25 column weights for deals_fts: customer_company, customer_spoc, customer_spoc_email, comments
+DEAL_COLUMN_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+def match_phrases(q):
+    """
+    FTS5 phrases for free text typed by a user; a row must match all of them.
+
+    Each whitespace-separated term is one phrase (so e-mail addresses and
+    hyphenated names keep their token order) and the last one also matches
+    as a prefix for search-as-you-type. Quoting every term means FTS5
+    operators and syntax characters in the input are treated as text.
+    """
+    terms = [term for term in (q or '').split() if re.search(r'\w', term)]
+    if not terms:
+        raise ValueError('q is required')
+    phrases = ['"' + term.replace('"', '""') + '"' for term in terms]
+    phrases[-1] += '*'
+    return phrases
+
+def _match_count(fts, match, cap):
+    """Number of rows of fts matching, counting no further than cap (a rowid-order scan, no scoring)"""
+    return db.session.execute(text(
+        f'SELECT COUNT(*) FROM (SELECT 1 FROM {fts} WHERE {fts} MATCH :match ORDER BY rowid DESC LIMIT :cap)'
+    ), {'match': match, 'cap': cap}).scalar()
+
+def _hits(fts, score_sql, phrases):
+    """SELECT of (hit_id, score) for every match in one FTS table (score: lower is better, NULL: unscored)"""
+    # bm25 reads the whole doclist of every phrase on its first call, however
+    # few rows match them all, so it only runs when every phrase is narrow
+    if all(_match_count(fts, phrase, SEARCH_CANDIDATES + 1) <= SEARCH_CANDIDATES for phrase in phrases):
+        return f'SELECT rowid AS hit_id, {score_sql} AS score FROM {fts} WHERE {fts} MATCH :match'
+    # Broad term: all matches, unscored; deal_matches ranks them by recency
+    return f'SELECT rowid AS hit_id, NULL AS score FROM {fts} WHERE {fts} MATCH :match'
+
+def deal_matches(q):
+    """
+    Subquery of (deal_id, score) for every deal matching q.
+
+    Deals matched only through unscored (broad) hits get 1/deal_id: positive,
+    so after every bm25 score (which FTS5 returns negated), and smaller for
+    newer deals.
+    """
+    phrases = match_phrases(q)
+    weights = ', '.join(str(weight) for weight in DEAL_COLUMN_WEIGHTS)
+    deal_hits = _hits('deals_fts', f'bm25(deals_fts, {weights})', phrases)
+    note_hits = _hits('deal_notes_fts', 'bm25(deal_notes_fts)', phrases)
+    return text(
+        'SELECT deal_id, COALESCE(MIN(score), 1.0 / deal_id) AS score FROM ('
+        f'SELECT hit_id AS deal_id, score FROM ({deal_hits}) '
+        'UNION ALL '
+        f'SELECT deal_notes.deal_id, note_hits.score FROM ({note_hits}) AS note_hits '
+        'JOIN deal_notes ON deal_notes.id = note_hits.hit_id'
+        ') GROUP BY deal_id'
+    ).bindparams(match=' '.join(phrases)).columns(deal_id=Integer, score=Float).subquery('matches')
@@ -0,0 +1,193 @@
+"""
+Deal rollup maintenance: company_deal_stats (per company, all time) and
+deal_daily_stats (per company and day, for time series)
+
+Deal write paths take a snapshot of the deal before and after the change and
+pass both to record_deal_change(), which applies the difference to both
+rollups inside the caller's transaction. verify/rebuild recompute the rollups
+from the deals table to detect and repair drift.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func, case, insert, select, union_all, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.database import db, Deal, CompanyDealStats, DealDailyStats
+
+STATS_FIELDS = ('total_deals', 'won_deals', 'won_revenue', 'open_deals',
+                'open_pipeline_value', 'in_progress_deals')
+
+DAILY_FIELDS = ('new_deals', 'new_pipeline_arr', 'won_deals', 'won_revenue')
+
+# What a deal contributes to the rollups: its company's totals and, per day
+# ({date: {field: value}}), its creation and its win
+DealSnapshot = namedtuple('DealSnapshot', ('company_id', 'totals', 'days'))
+
+# Float sums maintained incrementally may differ from a fresh SUM in the last bits
+RELATIVE_TOLERANCE = 1e-9
+
+def won_revenue_expr():
+    """Revenue credited for a won deal: revenue_actual when set (non-zero), else revenue_arr"""
+    return func.coalesce(func.nullif(Deal.revenue_actual, 0), Deal.revenue_arr)
+
+def deal_stats_columns():
+    """Aggregate columns computing the rollup fields over a set of deals"""
+    is_won = Deal.status == 'Won'
+    is_open = Deal.status == 'Open'
+    return [
+        func.count(Deal.id).label('total_deals'),
+        func.coalesce(func.sum(case((is_won, 1), else_=0)), 0).label('won_deals'),
+        func.coalesce(func.sum(case((is_won, won_revenue_expr()), else_=0.0)), 0.0).label('won_revenue'),
+        func.coalesce(func.sum(case((is_open, 1), else_=0)), 0).label('open_deals'),
+        func.coalesce(func.sum(case((is_open, func.coalesce(Deal.revenue_arr, 0)), else_=0.0)), 0.0).label('open_pipeline_value'),
+        func.coalesce(func.sum(case((Deal.status == 'In Progress', 1), else_=0)), 0).label('in_progress_deals'),
+    ]
+
+def _won_revenue(deal):
+    return float(deal.revenue_actual or deal.revenue_arr or 0.0)
+
+def snapshot_deal(deal):
+    """
+    Capture what a deal contributes to the rollups.
+
+    Returns a DealSnapshot or None for a deal that does not exist (before a
+    create / after a delete).
+    """
+    if deal is None:
+        return None
+    won = deal.status == 'Won'
+    is_open = deal.status == 'Open'
+    totals = {
+        'total_deals': 1,
+        'won_deals': 1 if won else 0,
+        'won_revenue': _won_revenue(deal) if won else 0.0,
+        'open_deals': 1 if is_open else 0,
+        'open_pipeline_value': float(deal.revenue_arr or 0.0) if is_open else 0.0,
+        'in_progress_deals': 1 if deal.status == 'In Progress' else 0,
+    }
+    # created_at is None until a new deal is flushed; its default is the current time
+    created_day = (deal.created_at or datetime.utcnow()).date()
+    days = {created_day: {'new_deals': 1, 'new_pipeline_arr': float(deal.revenue_arr or 0.0),
+                          'won_deals': 0, 'won_revenue': 0.0}}
+    if won:
+        won_day = (deal.won_at or deal.created_at or datetime.utcnow()).date()
+        day = days.setdefault(won_day, {'new_deals': 0, 'new_pipeline_arr': 0.0})
+        day.update(won_deals=1, won_revenue=_won_revenue(deal))
+    return DealSnapshot(deal.company_id, totals, days)
+
+def record_deal_change(before, after):
+    """
+    Apply the rollup delta between two deal snapshots in the current transaction.
+
+    Handles create (before=None), delete (after=None), status transitions,
+    revenue edits and a move between companies.
+    """
+    _apply_deltas(((before, -1), (after, 1)))
+
+def record_deals_created(snapshots):
+    """Apply the rollup for a batch of new deals with one upsert per company"""
+    _apply_deltas((snapshot, 1) for snapshot in snapshots)
+
+def _upsert_deltas(model, key_columns, fields, deltas, now):
+    """Add {key: {field: delta}} to model's rows, creating missing ones"""
+    for key, delta in deltas.items():
+        if not any(delta.values()):
+            continue
+        keys = dict(zip((column.key for column in key_columns), key))
+        stmt = sqlite_insert(model).values(**keys, updated_at=now, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={
+                **{field: getattr(model, field) + stmt.excluded[field] for field in fields},
+                'updated_at': now
+            }
+        )
+        db.session.execute(stmt)
+
+def _apply_deltas(signed_snapshots):
+    totals, daily = {}, {}
+    for snapshot, sign in signed_snapshots:
+        if snapshot is None:
+            continue
+        company_delta = totals.setdefault((snapshot.company_id,), dict.fromkeys(STATS_FIELDS, 0))
+        for field in STATS_FIELDS:
+            company_delta[field] += sign * snapshot.totals[field]
+        for day, values in snapshot.days.items():
+            day_delta = daily.setdefault((day, snapshot.company_id), dict.fromkeys(DAILY_FIELDS, 0))
+            for field in DAILY_FIELDS:
+                day_delta[field] += sign * values[field]
+
+    now = datetime.utcnow()
+    _upsert_deltas(CompanyDealStats, [CompanyDealStats.company_id], STATS_FIELDS, totals, now)
+    _upsert_deltas(DealDailyStats, [DealDailyStats.day, DealDailyStats.company_id], DAILY_FIELDS, daily, now)
+
+def compute_company_deal_stats():
+    """Recompute the rollup from the deals table: {company_id: {field: value}}"""
+    rows = db.session.query(Deal.company_id, *deal_stats_columns()).group_by(Deal.company_id).all()
+    return {row.company_id: {field: getattr(row, field) for field in STATS_FIELDS} for row in rows}
+
+def _drift(expected, actual, fields, key_names):
+    """Fields differing between {key: {field: value}} mappings, as drift items"""
+    zero = dict.fromkeys(fields, 0)
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, zero)
+        have = actual.get(key, zero)
+        for field in fields:
+            expected_value, actual_value = want[field] or 0, have[field] or 0
+            if abs(expected_value - actual_value) > RELATIVE_TOLERANCE * max(1.0, abs(expected_value)):
+                drift.append({
+                    **dict(zip(key_names, key)),
+                    'field': field,
+                    'expected': want[field],
+                    'actual': have[field]
+                })
+    return drift
+
+def verify_company_deal_stats():
+    """Compare the rollup with a fresh aggregate and return a list of drifted fields"""
+    expected = {(company_id,): values for company_id, values in compute_company_deal_stats().items()}
+    actual = {(s.company_id,): {field: getattr(s, field) for field in STATS_FIELDS}
+              for s in CompanyDealStats.query.all()}
+    return _drift(expected, actual, STATS_FIELDS, ('company_id',))
+
+def rebuild_company_deal_stats():
+    """Replace the whole rollup with a fresh set-based aggregate in one transaction"""
+    db.session.query(CompanyDealStats).delete(synchronize_session=False)
+    select_stats = db.session.query(
+        Deal.company_id, *deal_stats_columns(), func.datetime('now')
+    ).group_by(Deal.company_id)
+    db.session.execute(insert(CompanyDealStats).from_select(
+        ['company_id', *STATS_FIELDS, 'updated_at'], select_stats.statement))
+    db.session.commit()
+
+def deal_daily_stats_select(*criteria):
+    """SELECT of (day, company_id, *DAILY_FIELDS) computed from the deals matching criteria"""
+    created_day = func.date(func.coalesce(Deal.created_at, func.datetime('now')), type_=db.Date)
+    won_day = func.date(func.coalesce(Deal.won_at, Deal.created_at, func.datetime('now')), type_=db.Date)
+    created = select(created_day.label('day'), Deal.company_id.label('company_id'),
+                     literal(1).label('new_deals'), Deal.revenue_arr.label('new_pipeline_arr'),
+                     literal(0).label('won_deals'), literal(0.0).label('won_revenue')) \
+        .where(*criteria)
+    won = select(won_day, Deal.company_id, literal(0), literal(0.0), literal(1), won_revenue_expr()) \
+        .where(Deal.status == 'Won', *criteria)
+    deals = union_all(created, won).subquery('deal_days')
+    return select(deals.c.day, deals.c.company_id,
+                  *(func.sum(deals.c[field]).label(field) for field in DAILY_FIELDS)) \
+        .group_by(deals.c.day, deals.c.company_id)
+
+def verify_deal_daily_stats():
+    """Compare the daily rollup with a fresh aggregate and return a list of drifted fields"""
+    expected = {(row.day, row.company_id): {field: getattr(row, field) for field in DAILY_FIELDS}
+                for row in db.session.execute(deal_daily_stats_select())}
+    actual = {(s.day, s.company_id): {field: getattr(s, field) for field in DAILY_FIELDS}
+              for s in DealDailyStats.query.all()}
+    return _drift(expected, actual, DAILY_FIELDS, ('day', 'company_id'))
+
+def rebuild_deal_daily_stats():
+    """Replace the whole daily rollup with a fresh set-based aggregate in one transaction"""
+    db.session.query(DealDailyStats).delete(synchronize_session=False)
+    stats = deal_daily_stats_select().subquery()
+    db.session.execute(insert(DealDailyStats).from_select(
+        ['day', 'company_id', *DAILY_FIELDS, 'updated_at'],
+        select(*stats.c, func.datetime('now'))))
+    db.session.commit()
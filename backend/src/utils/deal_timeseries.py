@@ -0,0 +1,99 @@
+"""
+Deal time series from the deal_daily_stats rollup
+
+Groups the per-day, per-company rollup rows into day, week, month, quarter or
+year buckets (src/utils/periods.py), so a three-year monthly chart reads the
+rollup rows of those days rather than every deal. Days are UTC. Buckets
+with no activity are filled with zeros; buckets at the edges of a date range
+only count the days inside it.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from src.models.database import db, Company, DealDailyStats
+from src.utils.company_facets import LIST_FACETS, COLUMN_FACETS, filter_companies
+from src.utils.deal_stats import DAILY_FIELDS
+from src.utils.pagination import parse_date
+from src.utils.periods import GRANULARITIES, bucket_expr, bucket_label
+
+# Most buckets one response may cover (e.g. ~2.7 years by day)
+MAX_TIMESERIES_BUCKETS = 1000
+
+# Values of a bucket with no activity: counts are ints, amounts floats
+DAILY_ZEROS = {field: 0.0 if field in ('new_pipeline_arr', 'won_revenue') else 0 for field in DAILY_FIELDS}
+
+COMPANY_FILTERS = ('company_id', 'pam_id', *LIST_FACETS, *COLUMN_FACETS)
+
+def _matching_companies(args):
+    """Company id query for the company filters in args, or None when there are none"""
+    if not any(args.get(param) for param in COMPANY_FILTERS):
+        return None
+    query = db.session.query(Company.id)
+    if args.get('company_id'):
+        query = query.filter(Company.id == int(args['company_id']))
+    if args.get('pam_id'):
+        query = query.filter(Company.pam_id == int(args['pam_id']))
+    return filter_companies(query, args)
+
+def _bucket_labels(first_day, last_day, period):
+    """Every bucket label from first_day's bucket to last_day's, in order"""
+    labels, day = [], first_day
+    while day <= last_day:
+        label = bucket_label(day, period)
+        if not labels or labels[-1] != label:
+            if len(labels) == MAX_TIMESERIES_BUCKETS:
+                raise ValueError(f'Range covers more than {MAX_TIMESERIES_BUCKETS} {period} buckets; '
+                                 'narrow date_from/date_to or use a longer period')
+            labels.append(label)
+        day += timedelta(days=1)
+    return labels
+
+def deal_timeseries(args):
+    """
+    [{'period', 'new_deals', 'new_pipeline_arr', 'won_deals', 'won_revenue'}, ...]
+    oldest first.
+
+    ?period= day, week, month (default), quarter or year; date_from/date_to
+    (days, inclusive); company filters: company_id, pam_id and those of
+    src/utils/company_facets.py (tag, country, region, ...).
+    """
+    period, date_from, date_to = parse_timeseries_args(args)
+    rows = {row.period: row for row in timeseries_query(args, period, date_from, date_to)}
+
+    if not rows and not date_from:
+        return []
+    first_day = date_from or min(row.first_day for row in rows.values())
+    # Without date_to the series runs to today, so recent quiet periods show as zeros
+    last_day = date_to or max([datetime.utcnow().date(), *(row.first_day for row in rows.values())])
+
+    series = []
+    for label in _bucket_labels(first_day, last_day, period):
+        row = rows.get(label)
+        series.append({'period': label, **{field: getattr(row, field) if row else zero
+                                           for field, zero in DAILY_ZEROS.items()}})
+    return series
+
+def parse_timeseries_args(args):
+    """(period, first day, last day) from ?period=, ?date_from= and ?date_to="""
+    period = args.get('period', 'month')
+    if period not in GRANULARITIES:
+        raise ValueError(f'Invalid period. Valid values: {", ".join(GRANULARITIES)}')
+    date_from = parse_date(args['date_from']).date() if args.get('date_from') else None
+    date_to = parse_date(args['date_to']).date() if args.get('date_to') else None
+    return period, date_from, date_to
+
+def timeseries_query(args, period, date_from, date_to):
+    """Rollup rows summed per bucket: (period, first_day, *DAILY_FIELDS)"""
+    bucket = bucket_expr(DealDailyStats.day, period)
+    query = db.session.query(
+        bucket.label('period'),
+        func.min(DealDailyStats.day).label('first_day'),
+        *(func.sum(getattr(DealDailyStats, field)).label(field) for field in DAILY_FIELDS)
+    )
+    companies = _matching_companies(args)
+    if companies is not None:
+        query = query.filter(DealDailyStats.company_id.in_(companies.statement))
+    if date_from:
+        query = query.filter(DealDailyStats.day >= date_from)
+    if date_to:
+        query = query.filter(DealDailyStats.day <= date_to)
+    return query.group_by(bucket)
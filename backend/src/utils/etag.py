@@ -0,0 +1,62 @@
+"""
+Collection fingerprints and conditional GET for list endpoints
+
+A fingerprint is (row count, max(updated_at), max(id)) for the query a list
+endpoint would serve, plus the same for each table whose values end up in
+the payload (a deal carries its partner company's name, for instance). All
+of it is read with one aggregate statement, so answering If-None-Match with
+304 never loads or serializes a row. Any insert, update or delete changes at
+least one of the three values.
+"""
+import hashlib
+from flask import request, make_response
+from sqlalchemy import func, select
+from src.models.database import db, pam_company_assignments
+from src.utils.rbac import get_current_user
+
+def model_source(model, query=None):
+    """Fingerprint source for a model query (the whole table by default)"""
+    return (query if query is not None else model.query), model.updated_at, model.id
+
+def assignments_source():
+    """Fingerprint source for PAM-company assignments (keyed by assigned_at instead of updated_at)"""
+    return db.session.query(pam_company_assignments), pam_company_assignments.c.assigned_at, \
+        pam_company_assignments.c.pam_id
+
+def fingerprint(sources):
+    """One aggregate SELECT over every source; returns a tuple of values"""
+    columns = []
+    for query, updated_column, id_column in sources:
+        query = query.order_by(None)
+        columns += [
+            query.with_entities(func.count()).scalar_subquery(),
+            query.with_entities(func.max(updated_column)).scalar_subquery(),
+            query.with_entities(func.max(id_column)).scalar_subquery(),
+        ]
+    return tuple(db.session.execute(select(*columns)).one())
+
+def compute_etag(sources):
+    """ETag for the current request over sources (varies with the URL and the caller)"""
+    user = get_current_user()
+    identity = (user.id, user.role, user.company_id) if user else None
+    digest = hashlib.sha1(repr((request.full_path, identity, fingerprint(sources))).encode('utf-8'))
+    return digest.hexdigest()
+
+def conditional_response(sources, build_response):
+    """
+    Answer 304 if the client's If-None-Match matches the fingerprint of sources,
+    otherwise build the response and tag it.
+
+    ETags are weak because the same entity may be sent gzip-encoded or not.
+    """
+    etag = compute_etag(sources)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build_response())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    # Let clients cache, but always revalidate (the body depends on the caller)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,80 @@
+"""
+Password hashing on a bounded worker pool
+
+bcrypt releases the GIL, so running it on a small dedicated pool keeps the
+request threads of a worker responsive during a burst of logins. The
+number of hashes queued or running is capped; beyond that callers get
+PasswordHasherBusy (surfaced as 503) instead of an ever-growing backlog.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import os
+import threading
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', '32'))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool already has HASH_QUEUE_LIMIT jobs waiting"""
+
+# Created lazily per process: a pool inherited across fork (e.g. from a process
+# that hashed a password before forking workers) has no live worker threads
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _executor():
+    """This process's (executor, slot semaphore)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                _pool = (ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt'),
+                         threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT))
+                _pool_pid = pid
+    return _pool
+
+def _reset_after_fork():
+    global _pool, _pool_pid, _pool_lock
+    _pool, _pool_pid, _pool_lock = None, None, threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _run(fn, *args):
+    executor, slots = _executor()
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy('Too many password operations in progress, please retry')
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FuturesTimeoutError:
+        raise PasswordHasherBusy('Password operation timed out, please retry')
+
+def hash_password(password):
+    """Hash a password at the configured BCRYPT_ROUNDS cost"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+def verify_password(password, password_hash):
+    """Check a password against a stored bcrypt hash"""
+    return _run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_cost(password_hash):
+    """Cost factor encoded in a bcrypt hash ($2b$<cost>$...), or None if unreadable"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    """True when a stored hash uses a lower cost than BCRYPT_ROUNDS"""
+    cost = hash_cost(password_hash)
+    return cost is None or cost < BCRYPT_ROUNDS
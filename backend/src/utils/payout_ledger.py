@@ -0,0 +1,137 @@
+"""
+Payout ledger: batch payout runs over newly won deals
+"""
+from datetime import datetime
+from sqlalchemy import func, insert, literal, exists
+from sqlalchemy.orm import aliased
+from src.models.database import db, Deal, Company, User, Payout, PayoutRun
+from src.utils.periods import bucket_expr
+
+PAYOUT_STATUSES = ('Pending', 'Approved', 'Rejected')
+PAYOUT_GROUPINGS = ('company', 'pam', 'period')
+
+def last_watermark():
+    """Deal updated_at watermark recorded by the most recent payout run, if any"""
+    return db.session.query(PayoutRun.watermark) \
+        .filter(PayoutRun.watermark.isnot(None)) \
+        .order_by(PayoutRun.id.desc()).limit(1).scalar()
+
+def create_payout_run(since=None):
+    """
+    Record a payout for every won deal that does not have one yet.
+
+    The payouts are written by a single INSERT ... SELECT joining deals to
+    companies.payout_percentage, so each amount is computed once, in SQL,
+    and later reads only scan the stored rows. The unique deal_id index
+    makes a repeated run a no-op for deals already paid out. With since,
+    only deals updated after that watermark are considered.
+
+    Commits and returns the PayoutRun.
+    """
+    now = datetime.utcnow()
+    run = PayoutRun(created_at=now, watermark=db.session.query(func.max(Deal.updated_at)).scalar())
+    db.session.add(run)
+    db.session.flush()
+
+    percentage = func.coalesce(Company.payout_percentage, 0.0)
+    new_payouts = db.session.query(
+        Deal.id,
+        Deal.company_id,
+        literal(run.id),
+        Deal.revenue_arr,
+        percentage,
+        Deal.revenue_arr * percentage / 100.0,
+        literal('Pending'),
+        literal(now),
+        literal(now)
+    ).join(Company, Company.id == Deal.company_id) \
+     .filter(Deal.status == 'Won') \
+     .filter(~exists().where(Payout.deal_id == Deal.id))
+    if since is not None:
+        new_payouts = new_payouts.filter(Deal.updated_at > since)
+
+    result = db.session.execute(insert(Payout).from_select(
+        ['deal_id', 'company_id', 'run_id', 'revenue_arr', 'payout_percentage',
+         'payout_amount', 'status', 'created_at', 'updated_at'],
+        new_payouts.statement))
+
+    run.payouts_created = result.rowcount
+    run.total_amount = db.session.query(
+        func.coalesce(func.sum(Payout.payout_amount), 0.0)
+    ).filter(Payout.run_id == run.id).scalar()
+    db.session.commit()
+    return run
+
+def payout_totals_query(group_by=(), period='month', since=None):
+    """
+    Total won-deal payouts (revenue_arr * company payout_percentage) in one aggregate.
+
+    group_by may combine 'company', 'pam' and 'period'; periods bucket the
+    deal's won_at by month, quarter or year.
+    since restricts the totals to deals updated after a watermark that have
+    no payout yet, i.e. the deals create_payout_run(since) would pay out.
+    """
+    invalid = [g for g in group_by if g not in PAYOUT_GROUPINGS]
+    if invalid:
+        raise ValueError(f'Invalid group_by. Valid values: {", ".join(PAYOUT_GROUPINGS)}')
+
+    percentage = func.coalesce(Company.payout_percentage, 0.0)
+    pam = aliased(User)
+
+    keys = []
+    if 'company' in group_by:
+        keys += [Deal.company_id.label('company_id'), Company.name.label('company_name')]
+    if 'pam' in group_by:
+        keys += [Company.pam_id.label('pam_id'), pam.username.label('pam_name')]
+    if 'period' in group_by:
+        keys.append(bucket_expr(Deal.won_at, period).label('period'))
+
+    query = db.session.query(
+        *keys,
+        func.count(Deal.id).label('total_deals'),
+        func.coalesce(func.sum(Deal.revenue_arr * percentage / 100.0), 0.0).label('total_payouts')
+    ).select_from(Deal).outerjoin(Company, Company.id == Deal.company_id)
+    if 'pam' in group_by:
+        query = query.outerjoin(pam, pam.id == Company.pam_id)
+
+    query = query.filter(Deal.status == 'Won')
+    if since is not None:
+        query = query.filter(Deal.updated_at > since) \
+                     .filter(~exists().where(Payout.deal_id == Deal.id))
+    if keys:
+        query = query.group_by(*keys).order_by(*keys)
+    return query
+
+def payout_totals(group_by=(), period='month', since=None):
+    """payout_totals_query as a list of row dicts (a single row when not grouped)"""
+    return [row._asdict() for row in payout_totals_query(group_by, period, since).all()]
+
+def void_pending_payout(deal_id):
+    """
+    Remove the Pending payout of a deal that left Won or is being deleted, in
+    the caller's transaction. Approved and rejected payouts stay in the
+    ledger; a deal won again gets a new payout from the next run.
+    """
+    Payout.query.filter_by(deal_id=deal_id, status='Pending').delete(synchronize_session=False)
+
+def set_payout_status(payout_id, status):
+    """
+    Move a pending payout to Approved or Rejected; only payouts of deals that
+    are still Won can be approved.
+
+    Returns (payout, error); payout is None when it does not exist.
+    """
+    payout = Payout.query.get(payout_id)
+    if not payout:
+        return None, 'Payout not found'
+    if payout.status != 'Pending':
+        return payout, f'Payout is already {payout.status}'
+    if status == 'Approved':
+        deal = db.session.get(Deal, payout.deal_id)
+        if not deal:
+            return payout, 'Deal no longer exists'
+        if deal.status != 'Won':
+            return payout, f'Deal is no longer Won (status: {deal.status})'
+    payout.status = status
+    db.session.commit()
+    return payout, None
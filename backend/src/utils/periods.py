@@ -0,0 +1,60 @@
+"""
+Calendar period helpers for bucketing dates in SQL and in Python
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, cast, Integer, String, literal
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+def bucket_expr(column, granularity):
+    """
+    SQL expression labelling column's period as a sortable string.
+
+    day '2025-03-14', week '2025-03-10' (Monday), month '2025-03',
+    quarter '2025-Q1', year '2025'.
+    """
+    if granularity == 'day':
+        return func.strftime('%Y-%m-%d', column)
+    if granularity == 'week':
+        # SQLite's %w is 0 for Sunday; step back to the Monday of the same week
+        return func.date(column, '-' + cast((cast(func.strftime('%w', column), Integer) + 6) % 7, String) + ' days')
+    if granularity == 'month':
+        return func.strftime('%Y-%m', column)
+    if granularity == 'quarter':
+        quarter = (cast(func.strftime('%m', column), Integer) + 2) // 3
+        return func.strftime('%Y', column) + literal('-Q') + cast(quarter, String)
+    if granularity == 'year':
+        return func.strftime('%Y', column)
+    raise ValueError(f'Invalid period. Valid values: {", ".join(GRANULARITIES)}')
+
+def bucket_label(value, granularity):
+    """Python counterpart of bucket_expr for a single date/datetime"""
+    if granularity == 'day':
+        return value.strftime('%Y-%m-%d')
+    if granularity == 'week':
+        return (value - timedelta(days=value.weekday())).strftime('%Y-%m-%d')
+    if granularity == 'month':
+        return value.strftime('%Y-%m')
+    if granularity == 'quarter':
+        return f'{value.year}-Q{(value.month + 2) // 3}'
+    if granularity == 'year':
+        return value.strftime('%Y')
+    raise ValueError(f'Invalid period. Valid values: {", ".join(GRANULARITIES)}')
+
+def period_window(granularity, now=None):
+    """Return the [start, end) datetimes of the month/quarter/year containing now"""
+    now = now or datetime.utcnow()
+    if granularity == 'month':
+        start = datetime(now.year, now.month, 1)
+        months = 1
+    elif granularity == 'quarter':
+        start = datetime(now.year, 3 * ((now.month - 1) // 3) + 1, 1)
+        months = 3
+    elif granularity == 'year':
+        start = datetime(now.year, 1, 1)
+        months = 12
+    else:
+        raise ValueError(f'Invalid period window: {granularity}')
+    month_index = start.month - 1 + months
+    end = datetime(start.year + month_index // 12, month_index % 12 + 1, 1)
+    return start, end
@@ -1,30 +1,111 @@
 """
 Permission utilities for role-based access control
 """
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
+import threading
+import time
 import jwt
 import os
 
+SECRET_KEY = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+# How long a worker trusts its copy of a user's token_version before re-reading it
+TOKEN_VERSION_TTL = int(os.getenv('TOKEN_VERSION_TTL', '30'))
+
+class VerifiedTokenCache:
+    """Bounded LRU of token -> decoded payload; entries are dropped once the token expires"""
+    
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token):
+        with self._lock:
+            payload = self._entries.get(token)
+            if payload is None:
+                return None
+            if payload.get('exp') is not None and payload['exp'] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return payload
+    
+    def set(self, token, payload):
+        with self._lock:
+            self._entries[token] = payload
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def discard_user(self, user_id):
+        with self._lock:
+            for token in [t for t, p in self._entries.items() if p.get('user_id') == user_id]:
+                del self._entries[token]
+
+_verified_tokens = VerifiedTokenCache()
+
+# user_id -> (token_version, checked_at)
+_token_versions = {}
+_token_versions_lock = threading.Lock()
+
+def current_token_version(user_id):
+    """A user's token_version, re-read from the database at most every TOKEN_VERSION_TTL seconds"""
+    now = time.monotonic()
+    with _token_versions_lock:
+        entry = _token_versions.get(user_id)
+    if entry and now - entry[1] < TOKEN_VERSION_TTL:
+        return entry[0]
+    
+    from src.models.database import db, User
+    version = db.session.query(User.token_version).filter(User.id == user_id).scalar()
+    with _token_versions_lock:
+        _token_versions[user_id] = (version, now)
+    return version
+
+def revoke_user_tokens(user_id, token_version):
+    """Record a user's new token_version so tokens issued before it stop verifying"""
+    with _token_versions_lock:
+        _token_versions[user_id] = (token_version, time.monotonic())
+    _verified_tokens.discard_user(user_id)
+
+def verify_token(token):
+    """Decode a JWT, reusing the cached payload for tokens already verified"""
+    payload = _verified_tokens.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        _verified_tokens.set(token, payload)
+    
+    # Role or company changes bump token_version, revoking earlier tokens
+    if payload.get('token_version', 0) != current_token_version(payload.get('user_id')):
+        return None
+    return payload
+
 def get_current_user_from_token():
-    """Extract user info from JWT token"""
+    """Extract user info from JWT token (resolved once per request and kept on flask.g)"""
+    if 'current_principal' in g:
+        return g.current_principal
+    
+    principal = None
     try:
         auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return None
-        
-        token = auth_header.split(' ')[1]
-        secret_key = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
-        payload = jwt.decode(token, secret_key, algorithms=['HS256'])
-        
-        return {
-            'user_id': payload.get('user_id'),
-            'email': payload.get('email'),
-            'role': payload.get('role'),
-            'company_id': payload.get('company_id')
-        }
-    except:
-        return None
+        if auth_header.startswith('Bearer '):
+            payload = verify_token(auth_header.split(' ')[1])
+            if payload:
+                principal = {
+                    'user_id': payload.get('user_id'),
+                    'email': payload.get('email'),
+                    'role': payload.get('role'),
+                    'company_id': payload.get('company_id')
+                }
+    except Exception:
+        principal = None
+    
+    g.current_principal = principal
+    return principal
 
 def require_roles(*allowed_roles):
     """Decorator to require specific roles"""
@@ -105,11 +186,17 @@ def can_add_deals(user):
     return is_portal_admin(user) or is_pam(user) or is_spoc_admin(user) or is_team_member(user)
 
 def filter_by_company_access(user, query_result, company_id_field='company_id'):
-    """Filter query results based on user's company access"""
+    """Filter query results (a list, or a query which is restricted in SQL) based on user's company access"""
     if is_portal_admin(user):
         return query_result
     
-    user_company_id = user.get('company_id')
+    user_company_id = user.get('company_id') if user else None
+    
+    # Push the predicate into SQL when given an unexecuted query
+    if hasattr(query_result, 'filter') and hasattr(query_result, 'column_descriptions'):
+        entity = query_result.column_descriptions[0]['entity']
+        return query_result.filter(getattr(entity, company_id_field) == user_company_id)
+    
     if not user_company_id:
         return []
     
@@ -0,0 +1,147 @@
+"""
+Query-plan regression check
+
+Runs EXPLAIN QUERY PLAN over the filtered queries the routes issue and
+reports any that read a whole table (a "SCAN <table>" step) instead of
+searching an index. The statements are built by the same helpers the routes
+call (filter_deals, keyset_query, partner_performance_query, ...), so a
+change to a route's query is checked as the route runs it; only one-column
+lookups the routes write inline are restated here. Queries that list an
+entire table by design (the unfiltered list endpoints) are not part of the
+check; an entry may name such tables as a third element (partner performance
+returns a row for every company), and any other table must be searched.
+
+Used by `flask query-plans check`, which exits non-zero on any full scan.
+"""
+import re
+from datetime import datetime, timedelta
+from flask import current_app, g
+from src.models.database import db, User, Company, Target, pam_company_assignments
+from src.utils.pagination import keyset_query, encode_cursor
+from src.utils.company_facets import filter_companies
+from src.utils.rbac import scope_deals_query, scope_companies_query, ROLE_PAM, ROLE_PARTNER_SPOC_ADMIN
+from src.utils.target_progress import company_actuals_query
+from src.utils.sync import sync_entries_query, visible_rows_query
+from src.utils.deal_timeseries import parse_timeseries_args, timeseries_query
+from src.utils.deal_funnel import status_events_query, status_history_query
+from src.utils.payout_ledger import payout_totals_query
+
+SCAN_STEP = re.compile(r'^SCAN (\w+)')
+
+def _deal_queries(pam, spoc, start, end):
+    from src.routes.deals import DEAL_SORT_COLUMNS, filter_deals, search_deals_query
+    from src.models.database import Deal, DealNote
+
+    def page(args, user=None, sort='created_at', **kw):
+        query = scope_deals_query(Deal.query, user) if user else Deal.query
+        sort_column = DEAL_SORT_COLUMNS[sort]
+        query = filter_deals(query, args)
+        cursor = encode_cursor(start, 1000)
+        return keyset_query(query, sort_column, Deal.id, 50, cursor=cursor, **kw)
+
+    search, matches = search_deals_query({'q': 'acme', 'status': 'Open'})
+    return [
+        # GET /api/deals, /api/deals/archived and their filters, one page past a cursor
+        ('deal by id', Deal.query.filter(Deal.id == 1)),
+        ('deals page', page({})),
+        ('deals page ascending', page({}, descending=False)),
+        ('deals page by company', page({'company_id': '1'})),
+        ('deals page by status', page({'status': 'Open,In Progress'})),
+        ('deals page created in range', page({'date_from': start.isoformat(), 'date_to': end.isoformat()})),
+        ('deals page updated in range', page({'date_field': 'updated_at', 'date_from': start.isoformat(),
+                                              'date_to': end.isoformat()}, sort='updated_at')),
+        ('archived deals page', page({'status': 'Won,Lost'}, sort='updated_at')),
+        ('archived deals page by company', page({'status': 'Won,Lost', 'company_id': '1'}, sort='updated_at')),
+        ('deals page scoped to PAM', page({}, pam)),
+        ('deals page scoped to partner', page({}, spoc)),
+        ('deals filtered by company and status', filter_deals(Deal.query, {'company_id': '1', 'status': 'Won'})),
+        ('deal notes', DealNote.query.filter_by(deal_id=1).order_by(DealNote.created_at.desc())),
+        # GET /api/deals/search
+        ('deal search page', keyset_query(search, matches.c.score, matches.c.deal_id, 50,
+                                          cursor=encode_cursor(-1.5, 10), descending=False,
+                                          parse_sort_value=float)),
+    ]
+
+def _payout_queries(start):
+    from src.routes.payouts import filter_payouts
+    from src.models.database import Payout
+
+    def page(args):
+        return keyset_query(filter_payouts(Payout.query, args), Payout.created_at, Payout.id, 50,
+                            cursor=encode_cursor(start, 1000))
+
+    return [
+        ('payouts page by status', page({'status': 'Pending'})),
+        ('payouts page by company', page({'company_id': '1'})),
+        ('payouts by run', filter_payouts(Payout.query, {'run_id': '1'})),
+    ]
+
+def route_queries():
+    """(label, query[, tables it may scan]) entries for the filtered queries issued by the routes"""
+    from src.routes.analytics import partner_performance_query
+    pam = User(id=1, role=ROLE_PAM)
+    spoc = User(id=2, role=ROLE_PARTNER_SPOC_ADMIN, company_id=1)
+    start = datetime(2025, 1, 1)
+    end = start + timedelta(days=31)
+
+    # Helpers that scope by the signed-in user see a PAM
+    g.current_user = pam
+    timeseries_args = {'period': 'month', 'date_from': '2025-01-01', 'date_to': '2025-12-31', 'tag': 'x'}
+    return [
+        *_deal_queries(pam, spoc, start, end),
+        # Companies (duplicate checks on create/update, RBAC scoping, facet filters)
+        ('company by name', Company.query.filter_by(name='x')),
+        ('company by spoc_email', Company.query.filter_by(spoc_email='x')),
+        ('company by contact_email', Company.query.filter_by(contact_email='x')),
+        ('company by website', Company.query.filter_by(website='x')),
+        ('companies by pam', Company.query.filter_by(pam_id=1)),
+        ('companies scoped to PAM', scope_companies_query(Company.query, pam)),
+        ('companies by tag', filter_companies(Company.query, {'tag': 'x'})),
+        ('companies by region', filter_companies(Company.query, {'region': 'x'})),
+        ('PAMs of a company', db.session.query(pam_company_assignments.c.pam_id)
+            .filter(pam_company_assignments.c.company_id == 1)),
+        # Users
+        ('user by email', User.query.filter_by(email='x')),
+        ('users by role', User.query.filter_by(role=ROLE_PAM)),
+        ('users by company', User.query.filter_by(company_id=1)),
+        # Targets (GET /api/targets/progress)
+        ('targets by entity', Target.query.filter_by(target_type='Company', target_entity_id=1)),
+        ('target actuals for a period', company_actuals_query(start, end)),
+        # Payouts
+        *_payout_queries(start),
+        ('payout totals since a run', payout_totals_query((), since=start)),
+        # Delta sync (GET /api/sync)
+        ('sync changes since cursor', sync_entries_query(1, 1000)),
+        ('synced deals visible to PAM', visible_rows_query('deals', [1, 2])),
+        ('synced notes visible to PAM', visible_rows_query('deal_notes', [1, 2])),
+        # Analytics
+        ('partner performance', partner_performance_query({'tag': 'x'})),
+        ('partner performance for a date range', partner_performance_query(
+            {'date_from': start.isoformat(), 'date_to': end.isoformat()}), {'companies'}),
+        ('deal time series', timeseries_query(timeseries_args, *parse_timeseries_args(timeseries_args))),
+        ('funnel events after the last snapshot', status_events_query(start, end)),
+        ('funnel history of deals', status_history_query([1, 2], start)),
+    ]
+
+def explain(query):
+    """EXPLAIN QUERY PLAN detail lines for a Query or select()"""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    # Driver-level execute: the literal values must not be re-parsed as bind parameters
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return [row[-1] for row in rows]
+
+def find_full_scans(queries=None):
+    """Return [(label, plan)] for every query whose plan scans a whole table"""
+    tables = set(db.metadata.tables)
+    failures = []
+    # Route helpers read the request (signed-in user, query string)
+    with current_app.test_request_context():
+        for label, query, *allowed in (queries if queries is not None else route_queries()):
+            plan = explain(query)
+            for step in plan:
+                match = SCAN_STEP.match(step)
+                if match and match.group(1) in tables and match.group(1) not in (allowed[0] if allowed else ()):
+                    failures.append((label, plan))
+                    break
+    return failures
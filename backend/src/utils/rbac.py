@@ -2,8 +2,10 @@
 Role-Based Access Control (RBAC) utilities
 """
 from functools import wraps
-from flask import request, jsonify
-from src.models.database import User, Company
+from flask import request, jsonify, g, has_app_context
+from sqlalchemy import and_, false
+from src.models.database import db, User, Company, Deal, pam_company_assignments
+from src.utils.permissions import get_current_user_from_token
 
 # Role definitions
 ROLE_PORTAL_ADMIN = 'Portal Administrator'
@@ -11,54 +13,113 @@ ROLE_PAM = 'Partner Account Manager'
 ROLE_PARTNER_SPOC_ADMIN = 'Partner SPOC Admin'
 ROLE_PARTNER_TEAM_MEMBER = 'Partner Team Member'
 
+# Roles whose data access is limited to specific companies
+COMPANY_SCOPED_ROLES = (ROLE_PAM, ROLE_PARTNER_SPOC_ADMIN, ROLE_PARTNER_TEAM_MEMBER)
+
 def get_current_user():
-    """Get current user from request headers (mock implementation)"""
-    # In a real app, this would decode JWT token or session
-    # For now, return a mock user based on header
-    user_id = request.headers.get('X-User-Id')
-    if user_id:
-        return User.query.get(int(user_id))
-    return None
+    """Get the current User (resolved once per request and kept on flask.g)"""
+    if 'current_user' in g:
+        return g.current_user
+    
+    user = None
+    principal = get_current_user_from_token()
+    if principal:
+        user_id = principal['user_id']
+    else:
+        # Fallback for callers that identify themselves with a header
+        user_id = request.headers.get('X-User-Id')
+    try:
+        if user_id:
+            user = db.session.get(User, int(user_id))
+    except ValueError:
+        user = None
+    
+    g.current_user = user
+    return user
 
-def get_user_accessible_company_ids(user):
-    """Get list of company IDs the user has access to"""
+def _scope_by_company(query, company_id_column, user):
+    """Restrict query to rows whose company_id_column the user can access"""
     if not user:
-        return []
+        return query.filter(false())
     
     if user.role == ROLE_PORTAL_ADMIN:
-        # Portal Admin has access to all companies
-        return [c.id for c in Company.query.all()]
+        return query
     
-    elif user.role == ROLE_PAM:
-        # PAM has access to assigned companies
-        return [c.id for c in user.assigned_companies]
-    
-    elif user.role in [ROLE_PARTNER_SPOC_ADMIN, ROLE_PARTNER_TEAM_MEMBER]:
+    if user.role == ROLE_PAM:
+        # PAM has access to assigned companies; (pam_id, company_id) is the table's PK,
+        # so the join neither duplicates rows nor needs the id list in Python
+        return query.join(pam_company_assignments, and_(
+            pam_company_assignments.c.company_id == company_id_column,
+            pam_company_assignments.c.pam_id == user.id
+        ))
+    
+    if user.role in [ROLE_PARTNER_SPOC_ADMIN, ROLE_PARTNER_TEAM_MEMBER] and user.company_id:
         # Partner users have access to their single assigned company
-        return [user.company_id] if user.company_id else []
+        return query.filter(company_id_column == user.company_id)
     
-    return []
+    return query.filter(false())
+
+def scope_deals_query(query, user):
+    """Restrict a Deal query to the companies the user can access"""
+    return _scope_by_company(query, Deal.company_id, user)
+
+def scope_companies_query(query, user):
+    """Restrict a Company query to the companies the user can access"""
+    return _scope_by_company(query, Company.id, user)
+
+def scope_to_current_user(query, scope):
+    """Apply scope (scope_deals_query / scope_companies_query) for signed-in company-scoped users"""
+    user = get_current_user()
+    if user and user.role in COMPANY_SCOPED_ROLES:
+        return scope(query, user)
+    return query
+
+def accessible_company_id_set(user):
+    """Set of company IDs the user has access to, computed once per request"""
+    if not user:
+        return frozenset()
+    
+    cache = None
+    if has_app_context():
+        cache = g.setdefault('accessible_company_ids', {})
+        if user.id in cache:
+            return cache[user.id]
+    
+    ids = frozenset(company_id for (company_id,) in scope_companies_query(db.session.query(Company.id), user))
+    if cache is not None:
+        cache[user.id] = ids
+    return ids
+
+def get_user_accessible_company_ids(user):
+    """Get list of company IDs the user has access to"""
+    return sorted(accessible_company_id_set(user))
 
 def filter_companies_by_access(companies, user):
-    """Filter companies list based on user access"""
+    """Filter companies (a list, or a query which is restricted in SQL) based on user access"""
+    if hasattr(companies, 'filter'):
+        return scope_companies_query(companies, user)
+    
     if not user:
         return []
     
     if user.role == ROLE_PORTAL_ADMIN:
         return companies
     
-    accessible_ids = get_user_accessible_company_ids(user)
+    accessible_ids = accessible_company_id_set(user)
     return [c for c in companies if c.id in accessible_ids]
 
 def filter_deals_by_access(deals, user):
-    """Filter deals list based on user access"""
+    """Filter deals (a list, or a query which is restricted in SQL) based on user access"""
+    if hasattr(deals, 'filter'):
+        return scope_deals_query(deals, user)
+    
     if not user:
         return []
     
     if user.role == ROLE_PORTAL_ADMIN:
         return deals
     
-    accessible_company_ids = get_user_accessible_company_ids(user)
+    accessible_company_ids = accessible_company_id_set(user)
     return [d for d in deals if d.company_id in accessible_company_ids]
 
 def can_access_section(user, section):
@@ -105,7 +166,7 @@ def can_edit_company(user, company_id):
     
     if user.role == ROLE_PAM:
         # PAM can edit assigned companies
-        return company_id in [c.id for c in user.assigned_companies]
+        return company_id in accessible_company_id_set(user)
     
     return False
 
@@ -119,7 +180,7 @@ def can_edit_deal(user, deal):
     
     if user.role == ROLE_PAM:
         # PAM can edit deals from assigned companies
-        return deal.company_id in [c.id for c in user.assigned_companies]
+        return deal.company_id in accessible_company_id_set(user)
     
     if user.role in [ROLE_PARTNER_SPOC_ADMIN, ROLE_PARTNER_TEAM_MEMBER]:
         # Partner users can edit deals from their company
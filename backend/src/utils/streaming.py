@@ -0,0 +1,161 @@
+"""
+Streaming response utilities for large list endpoints
+"""
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from flask import Response, current_app, stream_with_context
+from src.models.database import db
+
+STREAM_BATCH_SIZE = 1000
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+
+def stream_format(request):
+    """
+    Decide whether the client asked for a streamed list.
+
+    Returns 'ndjson' (?stream=1 / ?stream=ndjson or an NDJSON Accept header),
+    'json' (?stream=json, a chunked JSON array) or None for a normal response.
+    """
+    stream = request.args.get('stream', '').lower()
+    if stream in ('1', 'true', 'ndjson'):
+        return 'ndjson'
+    if stream == 'json':
+        return 'json'
+    accept = request.headers.get('Accept', '')
+    if any(mimetype in accept for mimetype in NDJSON_MIMETYPES):
+        return 'ndjson'
+    return None
+
+def iter_query_batches(query, id_column, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield lists of rows from query in primary-key order, batch_size at a time.
+
+    Each batch is a separate `id > last_id ... LIMIT n` seek, so no cursor or
+    read transaction stays open between batches and only one batch of ORM
+    objects is alive at once.
+    """
+    last_id = None
+    while True:
+        batch_query = query.order_by(None).order_by(id_column)
+        if last_id is not None:
+            batch_query = batch_query.filter(id_column > last_id)
+        rows = batch_query.limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = getattr(rows[-1], id_column.key)
+
+def stream_batches(batches, fmt):
+    """
+    Build a generator response from an iterable of already-serialized lists.
+
+    'ndjson' writes one JSON document per line; 'json' writes a single JSON
+    array incrementally so clients expecting the regular payload still parse it.
+    """
+    dumps = current_app.json.dumps
+
+    if fmt == 'ndjson':
+        def generate():
+            for batch in batches:
+                if batch:
+                    yield ''.join(dumps(item) + '\n' for item in batch)
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            yield '['
+            first = True
+            for batch in batches:
+                if not batch:
+                    continue
+                chunk = ','.join(dumps(item) for item in batch)
+                yield chunk if first else ',' + chunk
+                first = False
+            yield ']'
+        mimetype = 'application/json'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def stream_query(query, id_column, serialize, fmt, batch_size=STREAM_BATCH_SIZE):
+    """Stream query results, serializing each batch with serialize(rows) -> list of dicts"""
+    batches = (serialize(rows) for rows in iter_query_batches(query, id_column, batch_size))
+    return stream_batches(batches, fmt)
+
+def wants_gzip(request):
+    """True for ?gzip=1 / ?gzip=true"""
+    return request.args.get('gzip', '').lower() in ('1', 'true')
+
+def iter_cursor_batches(query, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield lists of rows from a single streaming cursor, batch_size at a time.
+
+    sqlite3 steps the statement as rows are fetched, so with yield_per only
+    one batch is ever held in memory. Unlike iter_query_batches this keeps
+    one read transaction open for the whole result, which gives an export a
+    consistent snapshot (under WAL it does not block writers).
+    """
+    statement = getattr(query, 'statement', query)
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def csv_response(batches, header, filename, compress=False):
+    """
+    Stream an attachment of CSV rows from an iterable of row batches.
+
+    The header row is sent before the first query batch is read, so the
+    download starts at once. compress=True gzips the stream on the fly
+    (filename.gz, application/gzip).
+    """
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        yield buffer.getvalue()
+        for batch in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_csv_value(value) for value in row] for row in batch)
+            yield buffer.getvalue()
+
+    def generate():
+        if not compress:
+            for chunk in generate_csv():
+                yield chunk.encode('utf-8')
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for chunk in generate_csv():
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if compress:
+        filename += '.gz'
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/gzip' if compress else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Ask reverse proxies (nginx) to pass chunks through instead of buffering the file
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def stream_csv_export(request, query, columns, filename, batch_size=STREAM_BATCH_SIZE):
+    """CSV export of query; columns is a list of (header, column expression) pairs"""
+    header = [name for name, _ in columns]
+    query = query.with_entities(*(column for _, column in columns))
+    return csv_response(iter_cursor_batches(query, batch_size), header, filename,
+                        compress=wants_gzip(request))
@@ -0,0 +1,113 @@
+"""
+Delta sync over the sync_changes log
+
+Triggers give every row of a synced table one sync_changes entry carrying
+the sequence number of its latest insert, update or delete (see SYNC_TABLES
+in src/models/database.py). A client keeps the cursor from its last sync and
+asks for entries after it: one index range scan on seq, then one id lookup
+per table for the rows still present. Deleted rows come back as tombstones,
+and so do changed rows the user may no longer see (e.g. after a PAM is
+unassigned from a company, which re-logs its rows).
+Because SQLite commits writers one at a time, a change can never appear
+behind a cursor that a reader has already been given.
+"""
+import os
+from src.models.database import (User, Company, Deal, Target, DealNote, SyncChange,
+                                 serialize_users, serialize_companies, serialize_deals,
+                                 serialize_targets, serialize_deal_notes)
+from src.utils.rbac import (get_current_user, scope_to_current_user, scope_deals_query,
+                            scope_companies_query, accessible_company_id_set, COMPANY_SCOPED_ROLES)
+
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', '1000'))
+MAX_SYNC_PAGE_SIZE = int(os.getenv('MAX_SYNC_PAGE_SIZE', '5000'))
+
+# entity -> (model, scope for the signed-in user or None, serializer)
+SYNC_ENTITIES = {
+    'deals': (Deal, scope_deals_query, serialize_deals),
+    'companies': (Company, scope_companies_query, serialize_companies),
+    'deal_notes': (DealNote, scope_deals_query, serialize_deal_notes),
+    'users': (User, None, serialize_users),
+    'targets': (Target, None, serialize_targets),
+}
+
+def parse_since(args):
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise ValueError('since must be a cursor returned by a previous sync')
+    if since < 0:
+        raise ValueError('since must be a cursor returned by a previous sync')
+    return since
+
+def parse_sync_limit(args):
+    try:
+        limit = int(args.get('limit', SYNC_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_SYNC_PAGE_SIZE)
+
+def visible_rows_query(entity, ids):
+    """Query for the rows of entity with the given ids that the current user may see"""
+    model, scope, _ = SYNC_ENTITIES[entity]
+    # A page is at most MAX_SYNC_PAGE_SIZE ids, well within SQLite's parameter limit
+    query = model.query.filter(model.id.in_(ids))
+    if model is DealNote:
+        query = query.join(Deal, Deal.id == DealNote.deal_id)
+    if scope:
+        query = scope_to_current_user(query, scope)
+    return query
+
+def _tombstone_filter():
+    """Predicate on a tombstone's company_id for the current user (None if unrestricted)"""
+    user = get_current_user()
+    if not user or user.role not in COMPANY_SCOPED_ROLES:
+        return None
+    company_ids = accessible_company_id_set(user)
+    return lambda company_id: company_id in company_ids
+
+def sync_entries_query(since, limit):
+    """Log entries after since, oldest first: a page plus one row, to tell if more follow"""
+    return SyncChange.query.with_entities(SyncChange.entity, SyncChange.entity_id, SyncChange.seq,
+                                          SyncChange.deleted, SyncChange.company_id) \
+        .filter(SyncChange.seq > since).order_by(SyncChange.seq).limit(limit + 1)
+
+def changes_since(since, limit):
+    """
+    Up to limit changes after since.
+
+    Returns {'cursor', 'has_more', 'changes': {entity: [row, ...]},
+    'deleted': {entity: [id, ...]}}. Pass cursor as the next since; while
+    has_more is true there are further changes to fetch straight away.
+    """
+    entries = sync_entries_query(since, limit).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = {entity: [] for entity in SYNC_ENTITIES}
+    deleted = {entity: [] for entity in SYNC_ENTITIES}
+    visible = _tombstone_filter()
+    for entry in entries:
+        if entry.entity not in SYNC_ENTITIES:
+            continue
+        if not entry.deleted:
+            changed[entry.entity].append(entry.entity_id)
+        elif visible is None or SYNC_ENTITIES[entry.entity][1] is None or visible(entry.company_id):
+            deleted[entry.entity].append(entry.entity_id)
+
+    changes = {}
+    for entity, ids in changed.items():
+        rows = visible_rows_query(entity, ids).all() if ids else []
+        changes[entity] = SYNC_ENTITIES[entity][2](rows)
+        # Rows out of the user's scope (or gone since) must leave their copy
+        present = {row.id for row in rows}
+        deleted[entity].extend(entity_id for entity_id in ids if entity_id not in present)
+
+    return {
+        # An empty page keeps the client's cursor
+        'cursor': entries[-1].seq if entries else since,
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted,
+    }
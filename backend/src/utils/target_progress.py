@@ -0,0 +1,130 @@
+"""
+Target progress evaluation
+
+Actuals are computed per company with one grouped query per period window
+(monthly, quarterly, yearly), then rolled up to each target's entity:
+Company targets read their company directly, PAM targets sum the companies
+assigned in pam_company_assignments, SPOC targets use the SPOC user's company.
+Per-window company aggregates are cached until the next deal write.
+"""
+from datetime import datetime
+from sqlalchemy import func, case, and_
+from src.models.database import db, Deal, User, pam_company_assignments, serialize_targets
+from src.utils.cache import result_cache, data_version, DEFAULT_TTL
+from src.utils.deal_stats import won_revenue_expr
+from src.utils.periods import period_window
+
+# Target.target_period -> calendar window
+PERIOD_GRANULARITY = {
+    'monthly': 'month',
+    'quarterly': 'quarter',
+    'yearly': 'year',
+}
+
+METRICS = ('deals_count', 'won_deals', 'revenue')
+
+def company_actuals_query(start, end):
+    """
+    Per-company actuals for [start, end) in one GROUP BY:
+    deals created in the window, and deals won in it (by won_at) with their revenue.
+    """
+    created_in_window = and_(Deal.created_at >= start, Deal.created_at < end)
+    # won_at is only set while a deal is Won, so the range alone selects won deals (via ix_deals_won_at)
+    won_in_window = and_(Deal.won_at >= start, Deal.won_at < end)
+    return db.session.query(
+        Deal.company_id,
+        func.sum(case((created_in_window, 1), else_=0)),
+        func.sum(case((won_in_window, 1), else_=0)),
+        func.sum(case((won_in_window, won_revenue_expr()), else_=0.0))
+    ).filter(created_in_window | won_in_window).group_by(Deal.company_id)
+
+def company_actuals(start, end):
+    """{company_id: {metric: actual}} for [start, end), cached until the next write"""
+    cache_key = ('target_progress', start, end)
+    version = data_version()
+    cached = result_cache.get(cache_key, version)
+    if cached is not None:
+        return cached
+
+    rows = company_actuals_query(start, end).all()
+
+    actuals = {
+        company_id: {'deals_count': deals_count or 0, 'won_deals': won_deals or 0, 'revenue': revenue or 0.0}
+        for company_id, deals_count, won_deals, revenue in rows
+    }
+    result_cache.set(cache_key, version, DEFAULT_TTL, actuals)
+    return actuals
+
+def entity_company_ids(targets):
+    """Map each target to the company ids its entity covers, with one query per entity type"""
+    pam_ids = {t.target_entity_id for t in targets if t.target_type == 'PAM'}
+    spoc_ids = {t.target_entity_id for t in targets if t.target_type == 'SPOC'}
+
+    pam_companies = {}
+    if pam_ids:
+        rows = db.session.query(
+            pam_company_assignments.c.pam_id, pam_company_assignments.c.company_id
+        ).filter(pam_company_assignments.c.pam_id.in_(pam_ids)).all()
+        for pam_id, company_id in rows:
+            pam_companies.setdefault(pam_id, set()).add(company_id)
+
+    spoc_companies = {}
+    if spoc_ids:
+        spoc_companies = dict(db.session.query(User.id, User.company_id).filter(User.id.in_(spoc_ids)).all())
+
+    companies = {}
+    for t in targets:
+        if t.target_type == 'Company':
+            companies[t.id] = {t.target_entity_id}
+        elif t.target_type == 'PAM':
+            companies[t.id] = pam_companies.get(t.target_entity_id, set())
+        elif t.target_type == 'SPOC':
+            company_id = spoc_companies.get(t.target_entity_id)
+            companies[t.id] = {company_id} if company_id else set()
+        else:
+            companies[t.id] = set()
+    return companies
+
+def evaluate_targets(targets, as_of=None):
+    """
+    Return each target's dict extended with a 'progress' block:
+    actual, target, percentage, expected_to_date, pace (actual / expected,
+    1.0 = on track), projected (actual extrapolated to the period end) and
+    the period window.
+    """
+    as_of = as_of or datetime.utcnow()
+    companies = entity_company_ids(targets)
+
+    windows = {}
+    for period in {t.target_period for t in targets}:
+        granularity = PERIOD_GRANULARITY.get(period)
+        if granularity:
+            start, end = period_window(granularity, as_of)
+            windows[period] = (start, end, company_actuals(start, end))
+
+    results = []
+    for target, data in zip(targets, serialize_targets(targets)):
+        window = windows.get(target.target_period)
+        if not window or target.target_metric not in METRICS:
+            data['progress'] = None
+            results.append(data)
+            continue
+
+        start, end, actuals = window
+        actual = sum(actuals.get(company_id, {}).get(target.target_metric, 0)
+                     for company_id in companies[target.id])
+        elapsed = min(1.0, max(0.0, (as_of - start).total_seconds() / (end - start).total_seconds()))
+        expected = target.target_value * elapsed
+
+        data['progress'] = {
+            'actual': actual,
+            'target': target.target_value,
+            'percentage': (actual / target.target_value * 100) if target.target_value else None,
+            'expected_to_date': expected,
+            'pace': (actual / expected) if expected else None,
+            'projected': (actual / elapsed) if elapsed else None,
+            'period_start': start.isoformat(),
+            'period_end': end.isoformat()
+        }
+        results.append(data)
+    return results